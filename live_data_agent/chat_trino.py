@@ -7,9 +7,9 @@ import re
 
 from dotenv import load_dotenv
 
-# OpenAI-compatible client (sync, simple)
+# OpenAI-compatible client (sync, simple) over one or more replicas
 try:
-    from openai import OpenAI
+    from llm_pool import LLMPool, backend_urls_from_env
 except Exception:
     print("Please `pip install openai python-dotenv trino`", file=sys.stderr)
     raise
@@ -19,14 +19,14 @@ from trino_tool import query_sensor
 
 load_dotenv()
 
-LLAMA_URL   = os.getenv("LLAMA_URL")
+LLAMA_URLS  = backend_urls_from_env()
 LLAMA_MODEL = os.getenv("LLAMA_MODEL")
 LLAMA_API_KEY = os.getenv("LLAMA_API_KEY", "dummy")
 
-if not LLAMA_URL or not LLAMA_MODEL:
-    print("[warn] LLAMA_URL or LLAMA_MODEL not set. Check your environment.", file=sys.stderr)
+if not LLAMA_URLS or not LLAMA_MODEL:
+    print("[warn] LLAMA_URL(S) or LLAMA_MODEL not set. Check your environment.", file=sys.stderr)
 
-client = OpenAI(base_url=LLAMA_URL, api_key=LLAMA_API_KEY)
+client = LLMPool(LLAMA_URLS, model=LLAMA_MODEL, api_key=LLAMA_API_KEY) if LLAMA_URLS else None
 
 SYSTEM_PROMPT = (
     "You are a helpful assistant. When the user asks normal questions, answer normally. "
@@ -38,13 +38,11 @@ def llm_stream(prompt: str):
     """
     Stream tokens from the LLM (OpenAI-compatible chat.completions).
     """
-    stream = client.chat.completions.create(
-        model=LLAMA_MODEL,
+    stream = client.stream_sync(
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        stream=True,
     )
     for chunk in stream:
         delta = chunk.choices[0].delta.content if chunk.choices and chunk.choices[0].delta else None
@@ -149,8 +147,8 @@ def main():
     args = ap.parse_args()
 
     # Basic sanity checks
-    if not LLAMA_URL or not LLAMA_MODEL:
-        print("[error] Set LLAMA_URL and LLAMA_MODEL env vars first.", file=sys.stderr)
+    if not LLAMA_URLS or not LLAMA_MODEL:
+        print("[error] Set LLAMA_URL (or LLAMA_URLS) and LLAMA_MODEL env vars first.", file=sys.stderr)
         sys.exit(1)
 
     if args.prompt:
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# fake_llm.py — tiny OpenAI-compatible server for exercising llm_pool locally.
+#
+#   FAKE_LLM_NAME=a FAKE_LLM_DELAY_S=0.1 uvicorn fake_llm:app --port 8101
+#   FAKE_LLM_NAME=b FAKE_LLM_DELAY_S=3   uvicorn fake_llm:app --port 8102
+#   LLAMA_URLS=http://127.0.0.1:8101/v1,http://127.0.0.1:8102/v1 LLM_HEDGE_AFTER_S=0.5 python live_data_agent.py
+#
+# FAKE_LLM_DELAY_S is the time to first token; FAKE_LLM_FAIL_RATE makes a
+# fraction of requests return 503. FAKE_LLM_MAX_CONTEXT > 0 answers prompts
+# longer than that many (whitespace) tokens with a 400, like vLLM does.
+import os, json, time, random, asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_LLM_NAME      = os.getenv("FAKE_LLM_NAME", "fake")
+FAKE_LLM_MODEL     = os.getenv("LLAMA_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+FAKE_LLM_DELAY_S   = float(os.getenv("FAKE_LLM_DELAY_S", "0.2"))
+FAKE_LLM_FAIL_RATE = float(os.getenv("FAKE_LLM_FAIL_RATE", "0"))
+FAKE_LLM_MAX_CONTEXT = int(os.getenv("FAKE_LLM_MAX_CONTEXT", "0"))
+
+app = FastAPI(title=f"Fake LLM ({FAKE_LLM_NAME})")
+
+
+def _usage(body, text):
+    # Whitespace "tokens" over the whole prompt, so prefill growth is visible.
+    prompt = sum(len(str(m.get("content", "")).split()) for m in body.get("messages") or [])
+    completion = len(text.split())
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": FAKE_LLM_MODEL, "object": "model", "owned_by": FAKE_LLM_NAME}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < FAKE_LLM_FAIL_RATE:
+        return JSONResponse(status_code=503, content={"error": {"message": f"{FAKE_LLM_NAME} overloaded"}})
+    prompt_tokens = _usage(body, "")["prompt_tokens"]
+    if FAKE_LLM_MAX_CONTEXT and prompt_tokens > FAKE_LLM_MAX_CONTEXT:
+        return JSONResponse(status_code=400, content={"error": {
+            "message": f"This model's maximum context length is {FAKE_LLM_MAX_CONTEXT} tokens. "
+                       f"However, you requested {prompt_tokens} tokens.", "type": "BadRequestError"}})
+
+    last = (body.get("messages") or [{}])[-1].get("content", "")
+    text = f"[{FAKE_LLM_NAME}] echo: {last[:200]}"
+    rid, created, model = f"chatcmpl-{FAKE_LLM_NAME}-{time.time_ns()}", int(time.time()), body.get("model", FAKE_LLM_MODEL)
+
+    await asyncio.sleep(FAKE_LLM_DELAY_S)
+
+    if not body.get("stream"):
+        return {
+            "id": rid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(body, text),
+        }
+
+    async def sse():
+        for i, word in enumerate(text.split(" ")):
+            delta = {"content": (" " if i else "") + word}
+            chunk = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0.01)
+        done = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [], "usage": _usage(body, text)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
@@ -0,0 +1,38 @@
+# http_cache.py
+# Conditional-GET and compression helpers shared by server.py and sever.py.
+#
+# Sensor responses carry a strong ETag built from the selection and its data
+# version (last timestamp + row count). A poll whose If-None-Match still
+# matches gets a bodiless 304 without running the full query or serializing
+# anything. Responses above COMPRESS_MIN_BYTES are brotli-compressed when
+# brotli-asgi is installed, else gzip.
+import os, hashlib
+from typing import Optional
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# Browsers must revalidate every time, which makes them send If-None-Match.
+REVALIDATE = "no-cache"
+
+
+def etag_for(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20] + '"'
+
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 13.1.2), so W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+
+def add_compression(app) -> None:
+    try:
+        from brotli_asgi import BrotliMiddleware   # optional: pip install brotli-asgi
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_BYTES, gzip_fallback=True)
+    except ImportError:
+        from starlette.middleware.gzip import GZipMiddleware
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES)
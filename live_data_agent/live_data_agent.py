@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 # Cube Live Data Agent — minimal, reliable tool router (no Agents SDK)
+#
+# Startup is lazy: LLM/Trino clients, numpy and openai load on first use, and the
+# /models preflight runs in the background while the prompt is already up.
+# LLM_STARTUP_PROBE=1 restores the blocking "Pong" round trip.
+
+import time
+_T_IMPORT0 = time.perf_counter()
 
 import os, re, logging, asyncio, inspect
 from typing import Optional, Awaitable, Any, Tuple
 
 from dotenv import load_dotenv
-import httpx
-from openai import AsyncOpenAI
+
+from llm_pool import LLMPool
 
 # Tool implementations
 from trino_tool import list_sensors as trino_list_sensors, query_sensor as trino_query_sensor
-from prompt import LIVE_DATA_AGENT_PROMPT  # prepend to LLM prompts if you want
+from trino_tool import analyze_sensor as trino_analyze_sensor, correlate_sensors as trino_correlate_sensors
+from prompt import LIVE_DATA_AGENT_PROMPT  # fixed system prefix (prefix-cache friendly)
+from sessions import ChatSession
+from llm_cache import LLMCache
 
 # -----------------------------------------------------------------------------
 # Setup
@@ -19,34 +29,22 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
-def _normalize_base_url(url: Optional[str]) -> Optional[str]:
-    if not url:
-        return None
-    u = url.strip()
-    if not re.match(r"^https?://", u):
-        u = "http://" + u
-    u = u.rstrip("/")
-    if not u.endswith("/v1"):
-        u = u + "/v1"
-    return u
-
-LLAMA_URL   = _normalize_base_url(os.getenv("LLAMA_URL") or os.getenv("OPENAI_BASE_URL"))
-LLAMA_MODEL = os.getenv("LLAMA_MODEL") or os.getenv("OPENAI_MODEL") or os.getenv("MODEL")
-LLAMA_API_KEY = os.getenv("LLAMA_API_KEY") or os.getenv("OPENAI_API_KEY") or "sk-local-not-used"
 TOOL_TIMEOUT_S = int(os.getenv("TOOL_TIMEOUT_S", "10"))
+LLM_STARTUP_PROBE = os.getenv("LLM_STARTUP_PROBE", "0").lower() in ("1", "true", "yes")
 
-if not LLAMA_URL or not LLAMA_MODEL:
+try:
+    llama = LLMPool.from_env()
+except ValueError:
+    llama = None
+if llama is None or not llama.model:
     raise SystemExit(
-        "Set LLAMA_URL and LLAMA_MODEL (e.g. http://127.0.0.1:31913/v1, meta-llama/Llama-3.1-8B-Instruct)"
+        "Set LLAMA_URL (or LLAMA_URLS) and LLAMA_MODEL (e.g. http://127.0.0.1:31913/v1, meta-llama/Llama-3.1-8B-Instruct)"
     )
-
-llama = AsyncOpenAI(
-    base_url=LLAMA_URL,
-    api_key=LLAMA_API_KEY,
-    timeout=httpx.Timeout(connect=10.0, read=60.0, write=60.0, pool=30.0),
-    max_retries=1,
-)
-logger.info("LLM base_url=%s model=%s", LLAMA_URL, LLAMA_MODEL)
+LLAMA_MODEL = llama.model
+logger.info("LLM backends=%s model=%s", llama.urls, LLAMA_MODEL)
+llm_cache = LLMCache()
+_preflight_task: Optional[asyncio.Task] = None
+IMPORT_S = time.perf_counter() - _T_IMPORT0
 
 # -----------------------------------------------------------------------------
 # Helpers
@@ -65,45 +63,61 @@ async def _with_timeout(coro_or_fn, *args, **kwargs):
 
 async def _try_get(url: str) -> bool:
     try:
+        import httpx
         async with httpx.AsyncClient(timeout=3.0) as client:
             r = await client.get(url)
             return r.status_code == 200
     except Exception:
         return False
 
-async def _preflight_models() -> None:
-    if await _try_get(f"{LLAMA_URL}/models"):
-        return
+async def _preflight_backend(backend) -> bool:
+    url = backend.url
+    if await _try_get(f"{url}/models"):
+        return True
     alt = (
-        LLAMA_URL.replace("/v1", "/openai/v1")
-        if LLAMA_URL.endswith("/v1")
-        else f"{LLAMA_URL}/openai/v1"
+        url.replace("/v1", "/openai/v1")
+        if url.endswith("/v1")
+        else f"{url}/openai/v1"
     )
     alt = alt.rstrip("/")
     if await _try_get(f"{alt}/models"):
-        logger.info("Switched base URL to %s", alt)
-        globals()["LLAMA_URL"] = alt
-        llama._base_url = alt  # type: ignore[attr-defined]
-        return
-    raise SystemExit(f"Cannot reach {LLAMA_URL}/models or {alt}/models.")
-
-async def _chat_once(prompt: str) -> str:
-    """Non-streaming chat with tiny retry."""
-    msg = (
-        prompt
-        if not LIVE_DATA_AGENT_PROMPT
-        else f"{LIVE_DATA_AGENT_PROMPT.strip()}\n\nUser: {prompt}"
-    )
+        logger.info("Switched base URL %s -> %s", url, alt)
+        backend.set_url(alt)
+        return True
+    logger.warning("Cannot reach %s/models or %s/models.", url, alt)
+    return False
+
+async def _preflight_models() -> None:
+    t0 = time.perf_counter()
+    ok = await asyncio.gather(*(_preflight_backend(b) for b in llama.backends))
+    if not any(ok):
+        logger.error("Cannot reach any LLM backend: %s", llama.urls)
+    else:
+        logger.info("LLM preflight %.2fs (%d/%d backends up)", time.perf_counter() - t0, sum(ok), len(ok))
+
+async def _chat_once(prompt: str, session: Optional[ChatSession] = None) -> str:
+    """Chat with tiny retry. With a session, history is kept and the reply is appended to it."""
+    if _preflight_task is not None:
+        await _preflight_task      # may have switched a backend to its /openai/v1 path
     for attempt in range(2):
         try:
-            resp = await llama.chat.completions.create(
-                model=LLAMA_MODEL,
-                messages=[{"role": "user", "content": msg}],
-                stream=False,
-                temperature=0.3,
-                max_tokens=800,
-            )
-            return (resp.choices[0].message.content or "") if resp and resp.choices else ""
+            if session is not None:
+                return await session.reply(llama, prompt, cache=llm_cache, temperature=0.3, max_tokens=800)
+            messages = [
+                {"role": "system", "content": LIVE_DATA_AGENT_PROMPT.strip()},
+                {"role": "user", "content": prompt},
+            ]
+            params = {"model": LLAMA_MODEL, "temperature": 0.3, "max_tokens": 800}
+            cached = llm_cache.get(messages, params)
+            if cached is not None:
+                return cached
+            t0 = time.monotonic()
+            resp = await llama.chat(messages=messages, **params)
+            text = (resp.choices[0].message.content or "") if resp and resp.choices else ""
+            usage = getattr(resp, "usage", None)
+            llm_cache.put(messages, params, text, cost_s=time.monotonic() - t0,
+                          tokens=getattr(usage, "completion_tokens", 0) or 0)
+            return text
         except Exception as e:
             if attempt == 0:
                 logger.warning("direct chat attempt failed (%s), retrying...", e)
@@ -124,7 +138,7 @@ SENSORS_PATTERNS = [
 
 QUERY_PATTERN = re.compile(
     r"""^\s*
-        (query|show|get)\s+sensor\s+
+        (?P<verb>query|show|get|analy[sz]e)\s+sensor\s+
         (?P<id>[A-Za-z0-9_\-:.]+)
         (?:\s+window\s*=\s*(?P<window>[0-9]+[smhd]))?
         (?:\s+start\s*=\s*(?P<start>[^\s]+))?
@@ -133,6 +147,17 @@ QUERY_PATTERN = re.compile(
     re.I | re.X,
 )
 
+CORRELATE_PATTERN = re.compile(
+    r"""^\s*
+        (correlate|compare)\s+sensors?\s+
+        (?P<ids>[A-Za-z0-9_\-:.]+(?:\s*,\s*[A-Za-z0-9_\-:.]+)+)
+        (?:\s+window\s*=\s*(?P<window>[0-9]+[smhd]))?
+        (?:\s+step\s*=\s*(?P<step>[0-9]+(?:\.[0-9]+)?))?
+        (?:\s+lag\s*=\s*(?P<lag>[0-9]+))?
+        \s*$""",
+    re.I | re.X,
+)
+
 async def handle_tools(user_msg: str) -> Tuple[bool, str]:
     """Returns (handled, text). If handled=True, we ran a tool and return its text."""
     if any(p.search(user_msg) for p in SENSORS_PATTERNS):
@@ -142,19 +167,35 @@ async def handle_tools(user_msg: str) -> Tuple[bool, str]:
         except Exception as e:
             return True, f"[tool error] list_sensors: {e}"
 
+    m = CORRELATE_PATTERN.match(user_msg)
+    if m:
+        try:
+            out = await _with_timeout(
+                trino_correlate_sensors,
+                sensor_ids=m.group("ids"),
+                window=m.group("window") or "1h",
+                step_s=float(m.group("step")) if m.group("step") else None,
+                max_lag=int(m.group("lag")) if m.group("lag") else 10,
+            )
+            return True, str(out)
+        except Exception as e:
+            return True, f"[tool error] correlate_sensors({m.group('ids')}): {e}"
+
     m = QUERY_PATTERN.match(user_msg)
     if m:
         sensor_id = m.group("id")
         window = m.group("window")
         start = m.group("start")
         end = m.group("end")
+        analyze = m.group("verb").lower().startswith("analy")
+        tool = trino_analyze_sensor if analyze else trino_query_sensor
         try:
             out = await _with_timeout(
-                trino_query_sensor, sensor_id=sensor_id, start=start, end=end, window=window
+                tool, sensor_id=sensor_id, start=start, end=end, window=window
             )
             return True, str(out)
         except Exception as e:
-            return True, f"[tool error] query_sensor({sensor_id}): {e}"
+            return True, f"[tool error] {tool.__name__}({sensor_id}): {e}"
 
     return False, ""
 
@@ -165,11 +206,17 @@ async def _ainput(prompt: str = "") -> str:
     return await asyncio.to_thread(input, prompt)
 
 async def main():
-    await _preflight_models()
-    hello = await _chat_once("Say 'Pong!' in one word.")
-    logger.info("LLM probe: %r", hello)
+    global _preflight_task
+    t0 = time.perf_counter()
+    _preflight_task = asyncio.create_task(_preflight_models())
+    if LLM_STARTUP_PROBE:
+        hello = await _chat_once("Say 'Pong!' in one word.")
+        logger.info("LLM probe: %r", hello)
+    logger.info("startup: import %.3fs, main %.3fs", IMPORT_S, time.perf_counter() - t0)
+
+    session = ChatSession("terminal", LIVE_DATA_AGENT_PROMPT)
 
-    print("💬 Connected (simple tool router; non-streaming). Type a message (or /quit).\n")
+    print("💬 Connected (simple tool router; non-streaming). Type a message (or /quit, /stats).\n")
     while True:
         user_msg = await _ainput("you> ")
         if not user_msg:
@@ -177,15 +224,21 @@ async def main():
         if user_msg.strip().lower() in ("/q", "/quit", "exit"):
             print("bye!")
             break
+        if user_msg.strip().lower() == "/stats":
+            print(session.stats())
+            print({"llm_cache": llm_cache.stats()})
+            continue
 
         print("assistant> ", end="", flush=True)
 
         handled, text = await handle_tools(user_msg)
         if handled:
             print(text or "[empty tool result]")
+            # Keep tool results in history so follow-up questions can refer to them.
+            session.add_exchange(user_msg, text)
             continue
 
-        reply = await _chat_once(user_msg)
+        reply = await _chat_once(user_msg, session)
         print(reply or "[empty response]")
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+# llm_cache.py
+# Response cache for repeated / templated LLM prompts.
+#
+# Key: sha256 over the model, sampling params and the messages. Only the final
+# user question is normalized (case/whitespace/trailing punctuation folded);
+# the system prompt, earlier turns and tool output are hashed exactly, so
+# e.g. sensor ids that differ only by case never share an entry. Tool-grounded
+# answers also carry a fingerprint of the data they were built from (sensor,
+# last_ts, count); a lookup with a different fingerprint drops the entry
+# instead of serving a stale answer. Entries expire after LLM_CACHE_TTL_S and
+# the cache is LRU-bounded to LLM_CACHE_MAX entries.
+#
+# Optional: LLM_CACHE_SEMANTIC=1 also serves near-duplicate first-turn
+# questions whose embedding (EMBED_API / EMBED_MODEL) has cosine similarity
+# >= LLM_CACHE_SIM_THRESHOLD with a cached one. numpy is only imported when
+# semantic lookup is actually used, so it stays off the startup path.
+from __future__ import annotations
+
+import os, re, json, time, hashlib, logging, threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------- ENV ----------------------------- #
+LLM_CACHE_MAX           = int(os.getenv("LLM_CACHE_MAX", "2000"))
+LLM_CACHE_TTL_S         = float(os.getenv("LLM_CACHE_TTL_S", "900"))
+LLM_CACHE_SEMANTIC      = os.getenv("LLM_CACHE_SEMANTIC", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_SIM_THRESHOLD = float(os.getenv("LLM_CACHE_SIM_THRESHOLD", "0.95"))
+EMBED_API               = os.getenv("EMBED_API", "").strip().rstrip("/")
+EMBED_MODEL             = os.getenv("EMBED_MODEL", "").strip()
+
+# Sampling params that change the answer; everything else is ignored for keying.
+_KEY_PARAMS = ("model", "temperature", "top_p", "max_tokens", "stop", "seed")
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", str(text or "")).strip().lower().rstrip("?!. ")
+
+
+def _hash(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def tool_fingerprint(tool_output: Any) -> str:
+    """Identity of the data behind a tool result: (sensor, last_ts, count) when
+    present, otherwise a hash of the whole payload."""
+    data = tool_output
+    if isinstance(tool_output, str):
+        try:
+            data = json.loads(tool_output)
+        except ValueError:
+            return _hash(tool_output)
+    if isinstance(data, dict) and isinstance(data.get("summary"), dict):
+        s = data["summary"]
+        return _hash([data.get("sensor_id"), s.get("last_ts"), s.get("count")])
+    return _hash(data)
+
+
+class _Entry:
+    __slots__ = ("text", "context", "fingerprint", "vector", "expires", "cost_s", "tokens", "hits")
+
+    def __init__(self, text, context, fingerprint, vector, expires, cost_s, tokens):
+        self.text = text
+        self.context = context
+        self.fingerprint = fingerprint
+        self.vector = vector
+        self.expires = expires
+        self.cost_s = cost_s
+        self.tokens = tokens
+        self.hits = 0
+
+
+class LLMCache:
+    def __init__(self, max_entries: int = LLM_CACHE_MAX, ttl_s: float = LLM_CACHE_TTL_S,
+                 semantic: bool = LLM_CACHE_SEMANTIC, sim_threshold: float = LLM_CACHE_SIM_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.semantic = semantic and bool(EMBED_API and EMBED_MODEL)
+        self.sim_threshold = sim_threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0,
+                         "evictions": 0, "saved_gpu_s": 0.0, "saved_completion_tokens": 0}
+
+    # -------- keys --------
+    @staticmethod
+    def keys(messages: List[Dict[str, Any]], params: Dict[str, Any]):
+        """(exact key, context key). The context key leaves out the last message so
+        semantic lookups only compare questions asked in the same context. Only a
+        final user message is normalized; everything else must match exactly."""
+        p = {k: params.get(k) for k in _KEY_PARAMS if params.get(k) is not None}
+        msgs = [(m.get("role"), m.get("content", "")) for m in messages]
+        if msgs and msgs[-1][0] == "user":
+            msgs[-1] = ("user", normalize_text(msgs[-1][1]))
+        return _hash([p, msgs]), _hash([p, msgs[:-1]])
+
+    # -------- lookup / store --------
+    def get(self, messages, params: Dict[str, Any], fingerprint: Optional[str] = None,
+            vector: Optional[np.ndarray] = None) -> Optional[str]:
+        key, context = self.keys(messages, params)
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None and (e.expires < now or e.fingerprint != fingerprint):
+                # Expired, or the sensor data behind it has changed since.
+                self._entries.pop(key)
+                self.counters["invalidations" if e.expires >= now else "evictions"] += 1
+                e = None
+            if e is None and vector is not None:
+                e = self._nearest(context, fingerprint, vector, now)
+                if e is not None:
+                    self.counters["semantic_hits"] += 1
+            elif e is not None:
+                self._entries.move_to_end(key)
+            if e is None:
+                self.counters["misses"] += 1
+                return None
+            e.hits += 1
+            self.counters["hits"] += 1
+            self.counters["saved_gpu_s"] += e.cost_s
+            self.counters["saved_completion_tokens"] += e.tokens
+            return e.text
+
+    def put(self, messages, params: Dict[str, Any], text: str, fingerprint: Optional[str] = None,
+            vector: Optional[np.ndarray] = None, cost_s: float = 0.0, tokens: int = 0) -> None:
+        if not text:
+            return
+        key, context = self.keys(messages, params)
+        e = _Entry(text, context, fingerprint, vector, time.monotonic() + self.ttl_s, cost_s, int(tokens or 0))
+        with self._lock:
+            self._entries[key] = e
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _nearest(self, context: str, fingerprint: Optional[str], vector: np.ndarray, now: float) -> Optional[_Entry]:
+        cands = [e for e in self._entries.values()
+                 if e.vector is not None and e.context == context
+                 and e.fingerprint == fingerprint and e.expires >= now]
+        if not cands:
+            return None
+        import numpy as np
+        sims = np.stack([e.vector for e in cands]) @ vector
+        i = int(sims.argmax())
+        return cands[i] if sims[i] >= self.sim_threshold else None
+
+    # -------- embeddings (optional) --------
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Unit-norm embedding of `text`, or None when semantic lookup is off or fails. Blocking."""
+        if not self.semantic:
+            return None
+        try:
+            import httpx
+            import numpy as np
+            r = httpx.post(f"{EMBED_API}/embeddings", json={"model": EMBED_MODEL, "input": normalize_text(text)},
+                           timeout=5.0)
+            r.raise_for_status()
+            v = np.asarray(r.json()["data"][0]["embedding"], dtype=np.float32)
+            n = float(np.linalg.norm(v))
+            return v / n if n else None
+        except Exception as e:
+            logger.warning("LLM cache embedding failed: %s", e)
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+            c["entries"] = len(self._entries)
+        lookups = c["hits"] + c["misses"]
+        c["hit_rate"] = round(c["hits"] / lookups, 4) if lookups else None
+        c["saved_gpu_s"] = round(c["saved_gpu_s"], 3)
+        c["semantic"] = self.semantic
+        return c
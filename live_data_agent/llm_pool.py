@@ -0,0 +1,372 @@
+# llm_pool.py
+# Shared OpenAI-compatible client layer over one or more vLLM replicas.
+#
+#   LLAMA_URLS=http://vllm-0:8000/v1,http://vllm-1:8000/v1   (comma-separated)
+#   LLAMA_URL=http://vllm:8000/v1                            (single replica, legacy)
+#
+# Each request goes to the least-loaded healthy replica (in-flight count weighted
+# by recent latency). With LLM_HEDGE_AFTER_S > 0, a request whose first token
+# has not arrived in time is duplicated to a second replica and the loser is
+# cancelled. Failed replicas sit out for LLM_FAIL_COOLDOWN_S. Non-streaming
+# calls are run over a stream and joined, so both the hedge timer and the
+# latency EWMA always measure time-to-first-token, never a whole generation.
+#
+# Only connection errors, timeouts, 5xx and 429 count against a replica. Any
+# other API error (e.g. 400 for a prompt over the context length) is the
+# request's fault: it is raised at once, without cooldown or failover.
+#
+# Local try-out: start a few `fake_llm.py` servers with different delays and
+# point LLAMA_URLS at them.
+import os, re, time, asyncio, logging, threading
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Any, Iterable, Iterator, AsyncIterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------- ENV ----------------------------- #
+LLM_HEDGE_AFTER_S   = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))     # 0 disables hedging
+LLM_FAIL_COOLDOWN_S = float(os.getenv("LLM_FAIL_COOLDOWN_S", "15"))
+LLM_LATENCY_ALPHA   = float(os.getenv("LLM_LATENCY_ALPHA", "0.3"))   # EWMA weight of newest sample
+
+# httpx/openai are imported when the first client is built, not at import time.
+DEFAULT_TIMEOUT = None    # -> httpx.Timeout(connect=10, read=60, write=60, pool=30)
+
+
+def normalize_base_url(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    u = url.strip()
+    if not u:
+        return None
+    if not re.match(r"^https?://", u):
+        u = "http://" + u
+    u = u.rstrip("/")
+    if not u.endswith("/v1"):
+        u = u + "/v1"
+    return u
+
+
+def replica_fault(e: BaseException) -> bool:
+    """True if `e` says the replica is unhealthy (worth cooling down and retrying elsewhere)."""
+    import openai
+    if isinstance(e, openai.APIConnectionError):          # includes APITimeoutError
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code >= 500 or e.status_code == 429
+    return False
+
+
+def backend_urls_from_env(default: Optional[str] = None) -> List[str]:
+    """LLAMA_URLS (comma-separated) wins over LLAMA_URL / OPENAI_BASE_URL."""
+    raw = os.getenv("LLAMA_URLS") or os.getenv("LLAMA_URL") or os.getenv("OPENAI_BASE_URL") or default or ""
+    urls = [normalize_base_url(u) for u in raw.split(",")]
+    return list(dict.fromkeys(u for u in urls if u))
+
+
+# --------------------------- Backend --------------------------- #
+class Backend:
+    """One replica: lazily-built clients plus load/latency/health bookkeeping."""
+
+    def __init__(self, url: str, api_key: str, timeout=None):
+        self.url = url
+        self.inflight = 0
+        self.latency_s = 0.0      # EWMA of latency / time-to-first-token; 0 = no sample yet
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self._api_key = api_key
+        self._timeout = timeout
+        self._aclient = None
+        self._client = None
+
+    def _timeout_obj(self):
+        if self._timeout is None:
+            import httpx
+            self._timeout = httpx.Timeout(connect=10.0, read=60.0, write=60.0, pool=30.0)
+        return self._timeout
+
+    @property
+    def aclient(self) -> "AsyncOpenAI":
+        if self._aclient is None:
+            from openai import AsyncOpenAI
+            self._aclient = AsyncOpenAI(base_url=self.url, api_key=self._api_key,
+                                        timeout=self._timeout_obj(), max_retries=0)
+        return self._aclient
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.url, api_key=self._api_key,
+                                  timeout=self._timeout_obj(), max_retries=0)
+        return self._client
+
+    def set_url(self, url: str) -> None:
+        self.url = url
+        self._aclient = self._client = None
+
+    def healthy(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) >= self.down_until
+
+    def score(self) -> float:
+        # Unmeasured replicas score as fast so they get probed early.
+        return (self.inflight + 1) * (self.latency_s or 0.001)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "inflight": self.inflight,
+            "latency_s": round(self.latency_s, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy(),
+        }
+
+
+# ----------------------------- Pool ----------------------------- #
+class LLMPool:
+    def __init__(self, urls: Iterable[str], model: Optional[str], api_key: str = "sk-local-not-used",
+                 hedge_after_s: float = LLM_HEDGE_AFTER_S, timeout=DEFAULT_TIMEOUT):
+        self.backends = [Backend(u, api_key, timeout) for u in urls]
+        if not self.backends:
+            raise ValueError("LLMPool needs at least one backend URL")
+        self.model = model
+        self.hedge_after_s = hedge_after_s
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_url: Optional[str] = None, model: Optional[str] = None,
+                 api_key: Optional[str] = None, **kwargs) -> "LLMPool":
+        return cls(
+            backend_urls_from_env(default_url),
+            model=model or os.getenv("LLAMA_MODEL") or os.getenv("OPENAI_MODEL") or os.getenv("MODEL"),
+            api_key=api_key or os.getenv("LLAMA_API_KEY") or os.getenv("OPENAI_API_KEY") or "sk-local-not-used",
+            **kwargs,
+        )
+
+    @property
+    def urls(self) -> List[str]:
+        return [b.url for b in self.backends]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hedges": self.hedges, "backends": [b.stats() for b in self.backends]}
+
+    # -------- routing / bookkeeping --------
+    def pick(self, exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+        """Least-loaded healthy replica not in `exclude`; falls back to unhealthy ones."""
+        skip = set(map(id, exclude))
+        cands = [b for b in self.backends if id(b) not in skip]
+        if not cands:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in cands if b.healthy(now)]
+            return min(healthy or cands, key=Backend.score)
+
+    def _begin(self, b: Backend) -> float:
+        with self._lock:
+            b.inflight += 1
+            b.requests += 1
+        return time.monotonic()
+
+    def _observe(self, b: Backend, latency_s: float) -> None:
+        with self._lock:
+            b.latency_s = latency_s if not b.latency_s else (
+                LLM_LATENCY_ALPHA * latency_s + (1 - LLM_LATENCY_ALPHA) * b.latency_s)
+
+    def _censored(self, b: Backend, t0: float) -> None:
+        # A cancelled hedge loser took *at least* this long; without this a replica
+        # that always loses would never get a latency sample and keep being picked.
+        self._observe(b, max(time.monotonic() - t0, b.latency_s))
+
+    def _end(self, b: Backend, ok: Optional[bool]) -> None:
+        """ok=True success, False failure (starts cooldown), None cancelled (no verdict)."""
+        with self._lock:
+            b.inflight -= 1
+            if ok is True:
+                b.failures = 0
+                b.down_until = 0.0
+            elif ok is False:
+                b.failures += 1
+                b.down_until = time.monotonic() + LLM_FAIL_COOLDOWN_S
+        if ok is False:
+            logger.warning("LLM backend %s failed; cooling down %.0fs", b.url, LLM_FAIL_COOLDOWN_S)
+
+    def _fail(self, b: Backend, e: BaseException) -> bool:
+        """Release `b` after error `e`; cools it down and returns True only if the replica is at fault."""
+        fault = replica_fault(e)
+        self._end(b, False if fault else None)
+        return fault
+
+    def _can_hedge(self, pending: int, tried: int) -> bool:
+        return self.hedge_after_s > 0 and pending == 1 and tried < len(self.backends)
+
+    # -------- async --------
+    async def _afirst(self, b: Backend, t0: float, kwargs: Dict[str, Any]):
+        """Open a stream and wait for its first chunk. Returns (backend, stream, first_chunk|None)."""
+        stream = None
+        try:
+            stream = await b.aclient.chat.completions.create(**kwargs)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+        except asyncio.CancelledError:
+            self._censored(b, t0)
+            self._end(b, None)
+            if stream is not None:
+                asyncio.ensure_future(stream.close())
+            raise
+        except Exception as e:
+            self._fail(b, e)
+            raise
+        self._observe(b, time.monotonic() - t0)
+        return b, stream, first
+
+    async def _arace(self, fn, kwargs: Dict[str, Any]):
+        """Run fn on the best replica, hedging and failing over; return the first success."""
+        tried: List[Backend] = []
+        pending: Dict[asyncio.Future, Backend] = {}
+        last_exc: Optional[BaseException] = None
+
+        def launch() -> bool:
+            b = self.pick(exclude=tried)
+            if b is None:
+                return False
+            tried.append(b)
+            # Count the slot before the task runs so concurrent picks see it.
+            pending[asyncio.ensure_future(fn(b, self._begin(b), kwargs))] = b
+            return True
+
+        launch()
+        try:
+            while pending:
+                hedge = self._can_hedge(len(pending), len(tried))
+                done, _ = await asyncio.wait(list(pending), timeout=self.hedge_after_s if hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    logger.info("hedging LLM request after %.2fs", self.hedge_after_s)
+                    launch()
+                    continue
+                winner = None
+                for t in done:
+                    pending.pop(t)
+                    if t.exception() is not None:
+                        last_exc = t.exception()
+                        if not replica_fault(last_exc):
+                            raise last_exc
+                    elif winner is None:
+                        winner = t.result()
+                    else:
+                        await self._adiscard(t.result())
+                if winner is not None:
+                    return winner
+                if not pending:
+                    launch()
+        finally:
+            for t in pending:
+                t.cancel()
+        raise last_exc or RuntimeError("no LLM backend available")
+
+    async def _adiscard(self, result) -> None:
+        # A second stream that won a tie: close it and release its slot.
+        if isinstance(result, tuple):
+            b, stream, _ = result
+            try:
+                await stream.close()
+            finally:
+                self._end(b, None)
+
+    async def chat(self, **kwargs):
+        """Non-streaming chat, run over stream() so hedging applies to the first token only.
+
+        Returns a ChatCompletion-shaped object (choices[0].message.content, usage).
+        """
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        return _join([chunk async for chunk in self.stream(**kwargs)])
+
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        """Streaming chat; hedging applies to the first token only."""
+        kwargs.setdefault("model", self.model)
+        kwargs["stream"] = True
+        b, stream, first = await self._arace(self._afirst, kwargs)
+        ok: Optional[bool] = None
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+            ok = True
+        except Exception as e:
+            ok = False if replica_fault(e) else None
+            raise
+        finally:
+            self._end(b, ok)
+            await stream.close()
+
+    # -------- sync (CLI scripts) --------
+    def chat_sync(self, **kwargs):
+        """Blocking chat over stream_sync(): same routing and failover, no hedging."""
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        return _join(list(self.stream_sync(**kwargs)))
+
+    def stream_sync(self, **kwargs) -> Iterator[Any]:
+        """Blocking stream; fails over to another replica until the first chunk arrives (no hedging)."""
+        kwargs.setdefault("model", self.model)
+        kwargs["stream"] = True
+        tried: List[Backend] = []
+        last_exc: Optional[BaseException] = None
+        while True:
+            b = self.pick(exclude=tried)
+            if b is None:
+                raise last_exc or RuntimeError("no LLM backend available")
+            tried.append(b)
+            t0 = self._begin(b)
+            try:
+                stream = b.client.chat.completions.create(**kwargs)
+                it = iter(stream)
+                first = next(it, None)
+            except Exception as e:
+                if not self._fail(b, e):
+                    raise
+                last_exc = e
+                continue
+            self._observe(b, time.monotonic() - t0)
+            break
+
+        ok: Optional[bool] = None
+        try:
+            if first is not None:
+                yield first
+            for chunk in it:
+                yield chunk
+            ok = True
+        except Exception as e:
+            ok = False if replica_fault(e) else None
+            raise
+        finally:
+            self._end(b, ok)
+            stream.close()
+
+
+def _join(chunks: List[Any]) -> SimpleNamespace:
+    """Fold chat.completion.chunk objects into one ChatCompletion-shaped object."""
+    parts: List[str] = []
+    finish, usage, rid, model = None, None, None, None
+    for c in chunks:
+        rid = rid or getattr(c, "id", None)
+        model = model or getattr(c, "model", None)
+        if getattr(c, "usage", None):
+            usage = c.usage
+        for ch in c.choices or []:
+            if ch.delta is not None and ch.delta.content:
+                parts.append(ch.delta.content)
+            finish = ch.finish_reason or finish
+    message = SimpleNamespace(role="assistant", content="".join(parts))
+    return SimpleNamespace(id=rid, object="chat.completion", model=model, usage=usage,
+                           choices=[SimpleNamespace(index=0, message=message, finish_reason=finish)])
@@ -1,15 +1,139 @@
 # server.py
+# Multi-worker safe: run with `uvicorn server:app --workers N` (or WEB_CONCURRENCY=N).
+# Sensor metadata, latest values and query results live in one shared-memory
+# store (shared_store.py); one elected worker refreshes it, all workers read it.
+#
+# Probes: /healthz is liveness (process is up), /readyz is readiness (Trino
+# reachable and caches primed by a background warm-up started at boot). Each
+# warm worker heartbeats a ready:<boot>:<pid> key in the shared store, and /readyz
+# only passes once WEB_CONCURRENCY workers of this boot are warm, whichever
+# worker answers it. <boot> is shared by the workers of one server start, so
+# keys left in /dev/shm by a previous container (PIDs repeat) never count.
+import time
+_T_IMPORT0 = time.perf_counter()
+
 import os
+import json
 import asyncio
+import logging
+from contextlib import asynccontextmanager
 from functools import partial
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+from shared_store import SharedStore, open_store
+from http_cache import etag_for, not_modified, add_compression, REVALIDATE
+
 # your working trino helpers
-from trino_tool import list_sensors as trino_list_sensors, query_sensor as trino_query_sensor
+from trino_tool import (
+    list_sensors as trino_list_sensors,
+    query_sensor as trino_query_sensor,
+    analyze_sensor as trino_analyze_sensor,
+    correlate_sensors as trino_correlate_sensors,
+    latest_values as trino_latest_values,
+    sensor_version as trino_sensor_version,
+    query_sensor_since as trino_query_sensor_since,
+    ping as trino_ping,
+    warm_up as trino_warm_up,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARED_REFRESH_S   = float(os.getenv("SHARED_REFRESH_S", "5"))
+SHARED_QUERY_TTL_S = float(os.getenv("SHARED_QUERY_TTL_S", "10"))
+LATEST_WINDOW      = os.getenv("LATEST_WINDOW", "1h")
+WEB_CONCURRENCY    = int(os.getenv("WEB_CONCURRENCY", "1"))     # workers that must be warm for /readyz
+READY_TTL_S        = max(15.0, 3 * SHARED_REFRESH_S)
+
+store: SharedStore | None = None
+
+# Cold-start timings, reported by /healthz and /readyz.
+timings: dict = {"import_s": None, "startup_s": None, "ready_s": None}
+ready = False
+_warm_error: str | None = None
+
+async def _refresh_loop():
+    """Every worker runs this; only the flock-elected leader actually polls Trino."""
+    while True:
+        try:
+            if store is not None and store.try_lead():
+                sensors = await _run_bg(trino_list_sensors)
+                latest = await _run_bg(trino_latest_values, window=LATEST_WINDOW)
+                # TTL so readers stop serving data if the leader wedges.
+                await _run_bg(store.put_many, {"sensors": sensors.encode(), "latest": latest.encode()},
+                              ttl_s=max(60.0, 3 * SHARED_REFRESH_S), raw=True)
+        except Exception as e:
+            logger.warning("shared store refresh failed: %s", e)
+        if ready:
+            await _heartbeat()
+        await asyncio.sleep(SHARED_REFRESH_S)
+
+def _boot_token() -> str:
+    """Same for all workers of one server start, different after a restart: the
+    uvicorn supervisor's pid plus its start time (falls back to our own pid)."""
+    for pid in (os.getppid(), os.getpid()):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                start = f.read().rsplit(")", 1)[1].split()[19]     # field 22: starttime
+            return f"{pid}.{start}"
+        except (OSError, IndexError):
+            continue
+    return str(os.getppid())
+
+BOOT = _boot_token()
+
+async def _heartbeat():
+    """Publish this worker's readiness; it lapses READY_TTL_S after the worker stops."""
+    if store is None:
+        return
+    try:
+        await _run_bg(store.put_bytes, f"ready:{BOOT}:{os.getpid()}", b"1", ttl_s=READY_TTL_S)
+    except Exception as e:
+        logger.warning("readiness heartbeat failed: %s", e)
 
-app = FastAPI(title="Live Data Agent API")
+def _ready_workers() -> int:
+    if store is None:
+        return 0
+    prefix = f"ready:{BOOT}:"
+    return sum(1 for k in store.keys() if k.startswith(prefix) and store.get_bytes(k) is not None)
+
+async def _warm_up():
+    """Background readiness: Trino round trip, shared caches primed, numpy imported."""
+    global ready, _warm_error
+    delay = 0.5
+    while not ready:
+        try:
+            await _run_bg(trino_ping)
+            await _shared("sensors", trino_list_sensors, ttl_s=max(60.0, 3 * SHARED_REFRESH_S))
+            await _run_bg(trino_warm_up)
+            ready = True
+            _warm_error = None
+            await _heartbeat()
+            timings["ready_s"] = round(time.perf_counter() - _T_IMPORT0, 3)
+            logger.info("ready in %.2fs (import %.2fs, startup %.2fs)",
+                        timings["ready_s"], timings["import_s"], timings["startup_s"])
+        except Exception as e:
+            _warm_error = str(e)
+            logger.warning("warm-up failed, retrying in %.1fs: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10.0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global store
+    t0 = time.perf_counter()
+    store = open_store()
+    tasks = [asyncio.create_task(_refresh_loop()), asyncio.create_task(_warm_up())]
+    timings["startup_s"] = round(time.perf_counter() - t0, 4)
+    try:
+        yield
+    finally:
+        for t in tasks:
+            t.cancel()
+
+app = FastAPI(title="Live Data Agent API", lifespan=lifespan)
+add_compression(app)
 
 # CORS for your static index.html/app.js in a browser
 app.add_middleware(
@@ -24,32 +148,130 @@ app.add_middleware(
 async def health():
     return {"ok": True}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: never touches Trino or the LLM."""
+    return {"ok": True, "uptime_s": round(time.perf_counter() - _T_IMPORT0, 3), **timings}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """Readiness: 503 until this worker and WEB_CONCURRENCY workers in total are warm.
+
+    A worker that died keeps counting until its heartbeat lapses (READY_TTL_S).
+    """
+    workers = _ready_workers()
+    # Without a shared store there is nothing to count across workers.
+    if not ready or (store is not None and workers < WEB_CONCURRENCY):
+        response.status_code = 503
+    return {"ready": ready, "ready_workers": workers, "workers": WEB_CONCURRENCY,
+            "error": _warm_error, **timings}
+
 # helper to run sync Trino calls off the event loop
 async def _run_bg(fn, *args, **kwargs):
     loop = asyncio.get_running_loop()
     return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
 
+async def _shared_bytes(key: str, fn, ttl_s: float, **kwargs) -> bytes:
+    """`key` from the shared store, or fn(**kwargs) (a JSON string) computed and published."""
+    data = store.get_bytes(key) if store is not None else None
+    if data is None:
+        data = (await _run_bg(fn, **kwargs)).encode()
+        if store is not None:
+            # flock + memcpy: keep it off the event loop.
+            await _run_bg(store.put_bytes, key, data, ttl_s=ttl_s)
+    return data
+
+async def _shared(key: str, fn, ttl_s: float, **kwargs) -> Response:
+    """Serve `key` from the shared store, or compute it with fn (JSON string) and publish it.
+
+    The stored bytes are sent as-is: no json.loads/dumps round trip per request.
+    """
+    return Response(content=await _shared_bytes(key, fn, ttl_s, **kwargs), media_type="application/json")
+
 @app.get("/api/sensors")
 async def api_list_sensors():
     try:
-        data = await _run_bg(trino_list_sensors)
-        # list_sensors already returns JSON string; but FastAPI will double-encode.
-        # Return as dict so the client gets proper JSON, not a quoted string.
-        import json
-        return json.loads(data)
+        return await _shared("sensors", trino_list_sensors, ttl_s=max(60.0, 3 * SHARED_REFRESH_S))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"list_sensors failed: {e}")
 
+@app.get("/api/latest")
+async def api_latest_values():
+    try:
+        return await _shared("latest", trino_latest_values, ttl_s=max(60.0, 3 * SHARED_REFRESH_S),
+                             window=LATEST_WINDOW)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"latest_values failed: {e}")
+
+@app.get("/api/store/stats")
+async def api_store_stats():
+    return store.stats() if store is not None else {}
+
 @app.get("/api/sensor/{sensor_id}")
 async def api_query_sensor(
+    request: Request,
     sensor_id: str,
     window: str | None = Query(None, description="e.g. 1h, 24h, 10m"),
     start: str | None = None,
     end: str | None = None,
+    since: str | None = Query(None, description="only points after this (epoch ms from last_ms, or ISO8601)"),
 ):
+    sel = dict(sensor_id=sensor_id, start=start, end=end, window=window)
+    key = f"{sensor_id}|{window}|{start}|{end}"
     try:
-        data = await _run_bg(trino_query_sensor, sensor_id=sensor_id, start=start, end=end, window=window)
-        import json
-        return json.loads(data)
+        version = json.loads(await _shared_bytes(f"ver:{key}", trino_sensor_version, ttl_s=SHARED_QUERY_TTL_S, **sel))
+        etag = etag_for(key, since, version["last_ts"], version["count"])
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+        if not_modified(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if since:
+            # Every client has its own cursor, so deltas are not worth publishing.
+            data = (await _run_bg(trino_query_sensor_since, since=since, **sel)).encode()
+        else:
+            # Body cache key includes the version so a body always matches its ETag.
+            vkey = f"{key}|{version['last_ts']}|{version['count']}"
+            data = await _shared_bytes(f"query:{vkey}", trino_query_sensor, ttl_s=SHARED_QUERY_TTL_S, **sel)
+        return Response(content=data, media_type="application/json", headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"query_sensor failed: {e}")
+
+
+@app.get("/api/sensor/{sensor_id}/analytics")
+async def api_analyze_sensor(
+    sensor_id: str,
+    window: str | None = Query(None, description="e.g. 1h, 24h, 10m"),
+    start: str | None = None,
+    end: str | None = None,
+):
+    try:
+        data = await _run_bg(trino_analyze_sensor, sensor_id=sensor_id, start=start, end=end, window=window)
+        return json.loads(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"analyze_sensor failed: {e}")
+
+
+@app.get("/api/correlate")
+async def api_correlate_sensors(
+    sensor_ids: str = Query(..., description="comma-separated sensor ids"),
+    window: str | None = Query(None, description="e.g. 1h, 24h, 10m"),
+    start: str | None = None,
+    end: str | None = None,
+    step: float | None = Query(None, gt=0, description="grid step in seconds (default: auto)"),
+    max_lag: int = Query(10, ge=0, le=500, description="lag range in grid steps"),
+    matrix: bool = False,
+):
+    try:
+        data = await _run_bg(trino_correlate_sensors, sensor_ids=sensor_ids, start=start, end=end,
+                             window=window, step_s=step, max_lag=max_lag, include_matrix=matrix)
+        return json.loads(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"correlate_sensors failed: {e}")
+
+
+timings["import_s"] = round(time.perf_counter() - _T_IMPORT0, 4)
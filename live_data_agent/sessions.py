@@ -0,0 +1,227 @@
+# sessions.py
+# Server-side chat sessions with a token-budgeted sliding window.
+#
+# Prompt layout is chosen so vLLM automatic prefix caching keeps hitting:
+#
+#   [system: fixed prompt (+ rolling summary)] [turn 1] [turn 2] ... [new user msg]
+#
+# Everything before the new message is byte-identical to the previous request
+# of the same session, so only the newest turn has to be prefilled. When the
+# history outgrows SESSION_TOKEN_BUDGET, the oldest half of it is folded into
+# the summary in one go (not one turn at a time) so the shared prefix is
+# rewritten rarely rather than on every turn.
+#
+# A single message (e.g. a tool result the terminal agent keeps in history) is
+# capped at SESSION_MAX_MESSAGE_TOKENS when it is added, head and tail kept,
+# and compaction folds as many turns as it takes, so the history always gets
+# back under the budget.
+import os, time, uuid, asyncio, logging
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------- ENV ----------------------------- #
+SESSION_TOKEN_BUDGET  = int(os.getenv("SESSION_TOKEN_BUDGET", "3000"))   # history tokens kept verbatim
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "200"))
+SESSION_MAX_MESSAGE_TOKENS = int(os.getenv("SESSION_MAX_MESSAGE_TOKENS", str(SESSION_TOKEN_BUDGET // 4)))
+SESSION_MAX           = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_IDLE_TTL_S    = float(os.getenv("SESSION_IDLE_TTL_S", "3600"))
+SESSION_TURN_STATS    = int(os.getenv("SESSION_TURN_STATS", "50"))       # per-turn stats kept per session
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own future reference. Keep sensor ids, "
+    "time windows, numbers and any decisions or open questions. Be terse; no preamble."
+)
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 chars/token for Llama-style BPE on English; good enough for budgeting.
+    return len(text) // 4 + 4
+
+
+def cap_text(text: str, max_tokens: int = SESSION_MAX_MESSAGE_TOKENS) -> str:
+    """`text` cut to about `max_tokens` (approx_tokens), keeping its head and tail."""
+    limit = max(0, (max_tokens - 4) * 4)
+    if len(text) <= limit:
+        return text
+    marker = f"\n[... {len(text) - limit} chars trimmed ...]\n"
+    keep = limit - len(marker)
+    if keep <= 0:
+        return text[:limit]
+    head = keep // 2
+    return text[:head] + marker + text[len(text) - (keep - head):]
+
+
+class ChatSession:
+    def __init__(self, session_id: str, system_prompt: str):
+        self.id = session_id
+        self.system_prompt = system_prompt.strip()
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.turn_stats: List[Dict[str, Any]] = []
+        self.n_turns = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    # -------- prompt layout --------
+    def system_message(self) -> Dict[str, str]:
+        content = self.system_prompt
+        if self.summary:
+            content += f"\n\nSummary of the earlier conversation:\n{self.summary}"
+        return {"role": "system", "content": content}
+
+    def messages(self, user_msg: Optional[str] = None) -> List[Dict[str, str]]:
+        msgs = [self.system_message(), *self.turns]
+        if user_msg is not None:
+            msgs.append({"role": "user", "content": user_msg})
+        return msgs
+
+    def history_tokens(self) -> int:
+        return sum(approx_tokens(m["content"]) for m in self.turns)
+
+    def add_exchange(self, user_msg: str, reply: str) -> None:
+        self.turns.append({"role": "user", "content": cap_text(user_msg)})
+        self.turns.append({"role": "assistant", "content": cap_text(reply)})
+        self.n_turns += 1
+
+    # -------- window maintenance --------
+    async def compact(self, pool, budget: int = SESSION_TOKEN_BUDGET) -> None:
+        """Fold the oldest half of the history into the summary once it exceeds `budget`
+        (more if the newer half alone is still over it, up to the whole history)."""
+        if self.history_tokens() <= budget or not self.turns:
+            return
+        keep_from = len(self.turns) // 2
+        keep_from += keep_from % 2            # cut on a user/assistant boundary
+        while keep_from < len(self.turns) and sum(approx_tokens(m["content"]) for m in self.turns[keep_from:]) > budget:
+            keep_from += 2
+        old, self.turns = self.turns[:keep_from], self.turns[keep_from:]
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in old)
+        if self.summary:
+            transcript = f"Earlier summary: {self.summary}\n{transcript}"
+        try:
+            resp = await pool.chat(
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+                temperature=0.0,
+                max_tokens=SESSION_SUMMARY_TOKENS,
+            )
+            text = (resp.choices[0].message.content or "").strip() if resp and resp.choices else ""
+            self.summary = text or self.summary
+        except Exception as e:
+            # Losing detail is better than failing the user's turn.
+            logger.warning("session %s: summarization failed (%s); dropping %d messages", self.id, e, len(old))
+
+    # -------- one turn --------
+    async def reply(self, pool, user_msg: str, cache=None, **kwargs) -> str:
+        """Compact if needed, stream one completion, record prefill tokens and TTFT.
+
+        With an llm_cache.LLMCache, an identical prompt (same history) is served
+        from the cache; first-turn questions may also match semantically.
+        """
+        async with self.lock:
+            self.last_used = time.monotonic()
+            await self.compact(pool)
+            messages = self.messages(user_msg)
+
+            vector = None
+            if cache is not None:
+                if cache.semantic and not self.turns and not self.summary:
+                    vector = await asyncio.to_thread(cache.embed, user_msg)
+                cached = cache.get(messages, kwargs, vector=vector)
+                if cached is not None:
+                    self._record({"turn": self.n_turns + 1, "cache_hit": True,
+                                  "history_tokens_est": self.history_tokens()})
+                    self.add_exchange(user_msg, cached)
+                    return cached
+
+            t0 = time.monotonic()
+            ttft = None
+            usage = None
+            parts: List[str] = []
+            async for chunk in pool.stream(messages=messages, stream_options={"include_usage": True}, **kwargs):
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content if chunk.choices[0].delta else None
+                if delta:
+                    if ttft is None:
+                        ttft = time.monotonic() - t0
+                    parts.append(delta)
+            text = "".join(parts).strip()
+
+            details = getattr(usage, "prompt_tokens_details", None) if usage else None
+            completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
+            total_s = time.monotonic() - t0
+            self._record({
+                "turn": self.n_turns + 1,
+                "prompt_tokens": getattr(usage, "prompt_tokens", None) if usage else None,
+                "cached_tokens": getattr(details, "cached_tokens", None) if details else None,
+                "completion_tokens": completion_tokens,
+                "ttft_s": round(ttft, 4) if ttft is not None else None,
+                "total_s": round(total_s, 4),
+                "history_tokens_est": self.history_tokens(),
+            })
+            if cache is not None:
+                cache.put(messages, kwargs, text, vector=vector, cost_s=total_s, tokens=completion_tokens or 0)
+
+            self.add_exchange(user_msg, text)
+            return text
+
+    def _record(self, stat: Dict[str, Any]) -> None:
+        self.turn_stats.append(stat)
+        del self.turn_stats[:-SESSION_TURN_STATS]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "turns_total": self.n_turns,
+            "messages": len(self.turns),
+            "history_tokens_est": self.history_tokens(),
+            "has_summary": bool(self.summary),
+            "turns": list(self.turn_stats),
+        }
+
+
+class SessionStore:
+    """Bounded LRU of sessions; idle ones expire after SESSION_IDLE_TTL_S."""
+
+    def __init__(self, system_prompt: str, max_sessions: int = SESSION_MAX, idle_ttl_s: float = SESSION_IDLE_TTL_S):
+        self.system_prompt = system_prompt
+        self.max_sessions = max_sessions
+        self.idle_ttl_s = idle_ttl_s
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl_s
+        while self._sessions:
+            sid, s = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or s.last_used < cutoff:
+                self._sessions.pop(sid)
+            else:
+                break
+
+    def get(self, session_id: Optional[str]) -> Optional[ChatSession]:
+        s = self._sessions.get(session_id) if session_id else None
+        if s is not None:
+            self._sessions.move_to_end(session_id)
+        return s
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        s = self.get(session_id)
+        if s is None:
+            s = ChatSession(session_id or uuid.uuid4().hex, self.system_prompt)
+            self._sessions[s.id] = s
+        s.last_used = time.monotonic()
+        self._evict()
+        return s
+
+    def drop(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
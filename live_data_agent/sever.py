@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import os, re, json, asyncio
 from typing import Optional
-from fastapi import FastAPI, Query, Body
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi import FastAPI, Query, Body, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import uvicorn
@@ -10,22 +10,22 @@ import uvicorn
 # —— live data hooks ——
 # Uses YOUR working trino_tool (no changes)
 from trino_tool import list_sensors as trino_list_sensors, query_sensor as trino_query_sensor
-
-# —— LLM (OpenAI-compatible; vLLM) ——
-from openai import AsyncOpenAI
-import httpx
-
-LLAMA_URL   = os.getenv("LLAMA_URL", "http://127.0.0.1:31913/v1").rstrip("/")
-LLAMA_MODEL = os.getenv("LLAMA_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
-LLAMA_API_KEY = os.getenv("LLAMA_API_KEY", "sk-local-not-used")
-
-client = AsyncOpenAI(
-    base_url=LLAMA_URL,
-    api_key=LLAMA_API_KEY,
-    timeout=httpx.Timeout(connect=10.0, read=60.0, write=60.0, pool=30.0),
+from trino_tool import analyze_sensor as trino_analyze_sensor, correlate_sensors as trino_correlate_sensors
+from trino_tool import sensor_version as trino_sensor_version, query_sensor_since as trino_query_sensor_since
+from http_cache import etag_for, not_modified, add_compression, REVALIDATE
+
+# —— LLM (OpenAI-compatible; vLLM replicas via LLAMA_URLS or LLAMA_URL) ——
+from llm_pool import LLMPool
+from sessions import SessionStore
+from llm_cache import LLMCache
+
+client = LLMPool.from_env(
+    default_url="http://127.0.0.1:31913/v1",
+    model=os.getenv("LLAMA_MODEL", "meta-llama/Llama-3.1-8B-Instruct"),
 )
 
 app = FastAPI(title="Live Data Agent UI")
+add_compression(app)
 
 # Serve ./static for the front-end files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -43,14 +43,66 @@ async def api_list_sensors():
 
 @app.get("/api/sensor")
 async def api_query_sensor(
+    request: Request,
     sensor_id: str = Query(..., description="sensor_id to query"),
     window: Optional[str] = Query(None, description="e.g. 1h, 24h"),
     start: Optional[str] = Query(None, description="ISO8601 start"),
     end: Optional[str]   = Query(None, description="ISO8601 end"),
+    since: Optional[str] = Query(None, description="only points after this (epoch ms from last_ms, or ISO8601)"),
 ):
     try:
-        data = trino_query_sensor(sensor_id=sensor_id, start=start, end=end, window=window)
+        # Cheap version probe first: an unchanged sensor costs one tiny aggregate and a 304.
+        # Trino calls block, so they run in a thread to keep chat streams flowing.
+        version = json.loads(await asyncio.to_thread(
+            trino_sensor_version, sensor_id=sensor_id, start=start, end=end, window=window))
+        etag = etag_for(sensor_id, window, start, end, since, version["last_ts"], version["count"])
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+        if not_modified(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if since:
+            data = await asyncio.to_thread(trino_query_sensor_since, sensor_id=sensor_id, since=since,
+                                           start=start, end=end, window=window)
+        else:
+            data = await asyncio.to_thread(trino_query_sensor, sensor_id=sensor_id, start=start, end=end, window=window)
+        return Response(content=data, media_type="application/json", headers=headers)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/api/analytics")
+async def api_analyze_sensor(
+    sensor_id: str = Query(..., description="sensor_id to analyze"),
+    window: Optional[str] = Query(None, description="e.g. 1h, 24h"),
+    start: Optional[str] = Query(None, description="ISO8601 start"),
+    end: Optional[str]   = Query(None, description="ISO8601 end"),
+):
+    try:
+        data = await asyncio.to_thread(trino_analyze_sensor, sensor_id=sensor_id, start=start, end=end, window=window)
         return JSONResponse(content=json.loads(data))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/api/correlate")
+async def api_correlate_sensors(
+    sensor_ids: str = Query(..., description="comma-separated sensor ids"),
+    window: Optional[str] = Query(None, description="e.g. 1h, 24h"),
+    start: Optional[str] = Query(None, description="ISO8601 start"),
+    end: Optional[str]   = Query(None, description="ISO8601 end"),
+    step: Optional[float] = Query(None, gt=0, description="grid step in seconds (default: auto)"),
+    max_lag: int = Query(10, ge=0, le=500, description="lag range in grid steps"),
+    matrix: bool = Query(False, description="include the full correlation matrix"),
+):
+    try:
+        data = await asyncio.to_thread(trino_correlate_sensors, sensor_ids=sensor_ids, start=start, end=end,
+                                       window=window, step_s=step, max_lag=max_lag, include_matrix=matrix)
+        return JSONResponse(content=json.loads(data))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
@@ -58,6 +110,7 @@ async def api_query_sensor(
 # -------------------- API: chat (LLM) --------------------
 class ChatIn(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
 SYSTEM_PROMPT = (
     "You can answer normally, but when users ask about sensors or readings, "
@@ -65,23 +118,36 @@ SYSTEM_PROMPT = (
     "Be concise."
 )
 
+sessions = SessionStore(SYSTEM_PROMPT)
+llm_cache = LLMCache()
+
 @app.post("/api/chat")
 async def api_chat(payload: ChatIn):
+    session = sessions.get_or_create(payload.session_id)
+    headers = {"X-Session-Id": session.id}
     try:
-        resp = await client.chat.completions.create(
-            model=LLAMA_MODEL,
-            messages=[
-                {"role":"system","content": SYSTEM_PROMPT},
-                {"role":"user","content": payload.message}
-            ],
-            temperature=0.3,
-            max_tokens=600,
-            stream=False
-        )
-        text = (resp.choices[0].message.content or "").strip()
-        return PlainTextResponse(text)
+        text = await session.reply(client, payload.message, cache=llm_cache, temperature=0.3, max_tokens=600)
+        return PlainTextResponse(text, headers=headers)
     except Exception as e:
-        return PlainTextResponse(f"[chat error] {e}", status_code=500)
+        return PlainTextResponse(f"[chat error] {e}", status_code=500, headers=headers)
+
+
+@app.get("/api/chat/{session_id}/stats")
+async def api_chat_stats(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "unknown session"})
+    return session.stats()
+
+
+@app.delete("/api/chat/{session_id}")
+async def api_chat_reset(session_id: str):
+    return {"dropped": sessions.drop(session_id)}
+
+
+@app.get("/api/llm/stats")
+async def api_llm_stats():
+    return {**client.stats(), "cache": llm_cache.stats()}
 
 
 # Root -> simple redirect to static index
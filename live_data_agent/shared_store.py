@@ -0,0 +1,274 @@
+# shared_store.py
+# One memory-mapped segment shared by every uvicorn worker on the host/pod.
+#
+# Layout (SHARED_STORE_PATH, default /dev/shm/live_data_agent.store):
+#
+#   header: magic(8) seq capacity active idx_off idx_len end   -- u64s, 64 bytes
+#   half 0: values and index snapshots, appended from offset 0 up to `end`
+#   half 1: same; the target of the next compaction
+#
+# A put (writers are serialized with flock) appends the new values and then a
+# fresh index JSON {key: [offset, length, expires]} after `end` in the active
+# half. Published bytes are never touched, so a small put costs its own bytes
+# plus the index, not a copy of the whole store. Only when the active half is
+# full are the live values compacted into the other half, which then becomes
+# active. The header is updated last, with `seq` odd while it changes.
+#
+# Readers take no lock: read seq, slice the index/value, re-read seq and retry
+# if it moved (seqlock). Retries are bounded; a reader that cannot get a
+# consistent view treats it as a miss. Values are stored as ready-to-send JSON
+# bytes, so a hit is a memcpy with no re-serialization.
+#
+# The capacity is stored in the header; a segment left behind with another
+# SHARED_STORE_MB (or an older layout) is reset on open. The file's pages are
+# reserved with posix_fallocate up front: a sparse file on a too-small tmpfs
+# would otherwise SIGBUS a worker on first touch instead of failing at startup.
+# open_store() falls back to the temp dir, then to no shared store at all.
+#
+# A second flock file elects one leader worker to run the periodic refresh.
+import os, json, mmap, time, errno, fcntl, struct, logging, tempfile
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------- ENV ----------------------------- #
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "live_data_agent.store")
+SHARED_STORE_MB   = int(os.getenv("SHARED_STORE_MB", "24"))     # per half; the file is 2x this (fits Docker's 64 MiB /dev/shm)
+
+_MAGIC = b"LDASHM02"
+_HDR_SIZE = 64
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+_OFF_SEQ, _OFF_CAP, _OFF_ACTIVE, _OFF_IDX, _OFF_IDXLEN, _OFF_END = 8, 16, 24, 32, 40, 48
+_READ_RETRIES = 100
+
+
+class SharedStore:
+    def __init__(self, path: str = SHARED_STORE_PATH, capacity_mb: int = SHARED_STORE_MB):
+        self.path = path
+        self.capacity = capacity_mb * 1024 * 1024
+        size = _HDR_SIZE + 2 * self.capacity
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._leader_fd: Optional[int] = None
+        try:
+            with self._locked():
+                self._map(size)
+                self._check_header()
+        except OSError:
+            os.close(self._lock_fd)
+            raise
+        # Per-process cache of the parsed index, valid while seq is unchanged.
+        self._index_seq = -1
+        self._index: Dict[str, list] = {}
+        self._base = 0
+        self.read_failures = 0
+        self.compactions = 0
+
+    # -------- low level --------
+    def _check_header(self) -> None:
+        """Reset a segment from another layout or SHARED_STORE_MB. Caller holds the lock."""
+        if self._mm[:8] != _MAGIC or self._u64(_OFF_CAP) != self.capacity:
+            if self._mm[:8] == _MAGIC:
+                logger.warning("shared store: %s was sized for %d bytes, resetting for %d",
+                               self.path, self._u64(_OFF_CAP), self.capacity)
+            self._mm[:_HDR_SIZE] = bytes(_HDR_SIZE)
+            self._mm[:8] = _MAGIC
+            _U64.pack_into(self._mm, _OFF_CAP, self.capacity)
+
+    def _map(self, size: int) -> None:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)       # ENOSPC here, not SIGBUS on first touch
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _u64(self, off: int) -> int:
+        return _U64.unpack_from(self._mm, off)[0]
+
+    def _half_off(self, i: int) -> int:
+        return _HDR_SIZE + i * self.capacity
+
+    def _load_index(self) -> Tuple[int, Dict[str, list], int]:
+        """(seq, index, half_base) for the active half, retrying on concurrent writes.
+
+        Gives up after _READ_RETRIES and returns an empty index (seq -1: never cached).
+        """
+        for _ in range(_READ_RETRIES):
+            seq = self._u64(_OFF_SEQ)
+            if seq == self._index_seq:
+                return seq, self._index, self._base
+            if seq & 1:
+                continue
+            active, off, n = self._u64(_OFF_ACTIVE), self._u64(_OFF_IDX), self._u64(_OFF_IDXLEN)
+            base = self._half_off(active & 1)
+            raw = self._mm[base + off: base + off + n] if off + n <= self.capacity else None
+            if self._u64(_OFF_SEQ) != seq:
+                continue
+            if raw is None:
+                break
+            try:
+                index = json.loads(raw) if n else {}
+            except ValueError:
+                break               # seq is stable, so retrying would read the same bytes
+            self._index_seq, self._index, self._base = seq, index, base
+            return seq, index, base
+        self.read_failures += 1
+        return -1, {}, 0
+
+    # -------- reads (lock-free) --------
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        for _ in range(_READ_RETRIES):
+            seq, index, base = self._load_index()
+            ent = index.get(key)
+            if ent is None:
+                return None
+            o, n, expires = ent
+            if expires and expires < time.time():
+                return None
+            data = self._mm[base + o: base + o + n]
+            if self._u64(_OFF_SEQ) == seq:
+                return data
+        self.read_failures += 1
+        return None
+
+    def get(self, key: str) -> Any:
+        b = self.get_bytes(key)
+        return json.loads(b) if b is not None else None
+
+    def keys(self) -> Iterable[str]:
+        return list(self._load_index()[1])
+
+    # -------- writes (flock-serialized) --------
+    def put_many(self, items: Dict[str, Any], ttl_s: Optional[float] = None, raw: bool = False) -> None:
+        """Merge `items` into the store. Values are JSON-encoded unless raw=True (bytes).
+
+        Blocking (flock + memcpy); call it off the event loop.
+        """
+        now = time.time()
+        expires = now + ttl_s if ttl_s else 0
+        new = {k: (v if raw else json.dumps(v, ensure_ascii=False).encode()) for k, v in items.items()}
+        with self._locked():
+            seq, index, base = self._load_index()
+            if seq < 0:
+                index, base = {}, self._half_off(self._u64(_OFF_ACTIVE) & 1)
+            live = {k: e for k, e in index.items() if k not in new and (not e[2] or e[2] >= now)}
+            if not self._append(live, new, expires):
+                self._compact(live, base, new, expires)
+
+    def put(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        self.put_many({key: value}, ttl_s=ttl_s)
+
+    def put_bytes(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self.put_many({key: value}, ttl_s=ttl_s, raw=True)
+
+    def _append(self, live: Dict[str, list], new: Dict[str, bytes], expires: float) -> bool:
+        """Write `new` and a fresh index after `end` in the active half; False if it does not fit."""
+        if self._u64(_OFF_SEQ) & 1:
+            return False            # a writer died mid-publish; rebuild from scratch
+        active = self._u64(_OFF_ACTIVE) & 1
+        end = self._u64(_OFF_END)
+        index = dict(live)
+        off = end
+        for k, v in new.items():
+            index[k] = [off, len(v), expires]
+            off += len(v)
+        ib = json.dumps(index, separators=(",", ":")).encode()
+        if off + len(ib) > self.capacity:
+            return False
+        p = self._half_off(active)
+        for v in new.values():
+            self._mm[p + end: p + end + len(v)] = v
+            end += len(v)
+        self._mm[p + off: p + off + len(ib)] = ib
+        self._publish(active, off, len(ib), off + len(ib))
+        return True
+
+    def _compact(self, live: Dict[str, list], base: int, new: Dict[str, bytes], expires: float) -> None:
+        """Copy live + new values into the inactive half, evicting soonest-expiring entries to fit."""
+        entries: Dict[str, Tuple[Any, float]] = {k: ((o, n), exp) for k, (o, n, exp) in live.items()}
+        entries.update({k: (v, expires) for k, v in new.items()})
+        size = lambda v: v[1] if isinstance(v, tuple) else len(v)
+        order = sorted(entries, key=lambda k: entries[k][1] or float("inf"))
+        while True:
+            index, off = {}, 0
+            for k, (v, exp) in entries.items():
+                index[k] = [off, size(v), exp]
+                off += size(v)
+            ib = json.dumps(index, separators=(",", ":")).encode()
+            if off + len(ib) <= self.capacity or not order:
+                break
+            entries.pop(order.pop(0))
+        if off + len(ib) > self.capacity:
+            logger.warning("shared store: snapshot does not fit in %d bytes; nothing written", self.capacity)
+            return
+
+        target = 1 - (self._u64(_OFF_ACTIVE) & 1)
+        p = self._half_off(target)
+        for k, (v, _) in entries.items():
+            o = index[k][0]
+            self._mm[p + o: p + o + size(v)] = self._mm[base + v[0]: base + v[0] + v[1]] if isinstance(v, tuple) else v
+        self._mm[p + off: p + off + len(ib)] = ib
+        self._publish(target, off, len(ib), off + len(ib))
+        self.compactions += 1
+
+    def _publish(self, active: int, idx_off: int, idx_len: int, end: int) -> None:
+        seq = self._u64(_OFF_SEQ) | 1
+        _U64.pack_into(self._mm, _OFF_SEQ, seq)                     # odd: header changing
+        _U64.pack_into(self._mm, _OFF_ACTIVE, active)
+        _U64.pack_into(self._mm, _OFF_IDX, idx_off)
+        _U64.pack_into(self._mm, _OFF_IDXLEN, idx_len)
+        _U64.pack_into(self._mm, _OFF_END, end)
+        _U64.pack_into(self._mm, _OFF_SEQ, seq + 1)                 # even: snapshot published
+
+    # -------- leader election --------
+    def try_lead(self) -> bool:
+        """Non-blocking; the lock is held for the life of the process (the OS drops it if we die)."""
+        if self._leader_fd is not None:
+            return True
+        fd = os.open(self.path + ".leader", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        logger.info("shared store: pid %d is the refresh leader", os.getpid())
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        seq, index, _ = self._load_index()
+        return {"path": self.path, "seq": seq, "entries": len(index),
+                "bytes_used": self._u64(_OFF_END), "capacity": self.capacity,
+                "compactions": self.compactions, "read_failures": self.read_failures,
+                "leader": self._leader_fd is not None, "pid": os.getpid()}
+
+
+def open_store(path: str = SHARED_STORE_PATH, capacity_mb: int = SHARED_STORE_MB) -> Optional[SharedStore]:
+    """SharedStore at `path`, else in the temp dir, else None (callers run without a shared cache)."""
+    fallback = os.path.join(tempfile.gettempdir(), os.path.basename(path))
+    for p in dict.fromkeys((path, fallback)):
+        try:
+            return SharedStore(p, capacity_mb)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                try:
+                    os.truncate(p, 0)         # give the reserved-but-unusable space back
+                except OSError:
+                    pass
+            logger.warning("shared store: cannot use %s (%d MiB x 2): %s", p, capacity_mb, e)
+    logger.error("shared store disabled; every worker queries Trino on its own")
+    return None
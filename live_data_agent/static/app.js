@@ -9,6 +9,9 @@ const windowSel = $("#window");
 const queryBtn = $("#btn-query");
 const sensorOut = $("#sensor-out");
 
+// Server-side chat session (keeps history for follow-up questions)
+let sessionId = null;
+
 function addBubble(text, who="bot") {
   const row = document.createElement("div");
   row.className = who === "me" ? "me" : "bot";
@@ -22,6 +25,8 @@ function addBubble(text, who="bot") {
 
 async function api(path, opts={}) {
   const r = await fetch(path, opts);
+  const sid = r.headers.get("x-session-id");
+  if (sid) sessionId = sid;
   if (!r.ok) throw new Error(`${r.status} ${r.statusText}`);
   const ct = r.headers.get("content-type") || "";
   if (ct.includes("application/json")) return r.json();
@@ -39,7 +44,7 @@ async function doSend() {
     const text = await api("/api/chat", {
       method: "POST",
       headers: { "content-type": "application/json" },
-      body: JSON.stringify({ message: msg })
+      body: JSON.stringify({ message: msg, session_id: sessionId })
     });
     addBubble(typeof text === "string" ? text : JSON.stringify(text, null, 2), "bot");
   } catch (e) {
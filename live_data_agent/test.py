@@ -3,19 +3,21 @@ import os
 import re
 import json
 import sys
+import time
 from typing import Any, Dict, Tuple
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_pool import LLMPool
+from llm_cache import LLMCache, tool_fingerprint
 from trino_tool import query_sensor  # uses the fixed SQL with date_add()
 
 load_dotenv()
 
-LLAMA_URL   = os.getenv("LLAMA_URL", "http://localhost:8000/v1")
 LLAMA_KEY   = os.getenv("LLAMA_API_KEY", "dummy")
 LLAMA_MODEL = os.getenv("LLAMA_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
 
-client = OpenAI(base_url=LLAMA_URL, api_key=LLAMA_KEY)
+client = LLMPool.from_env(default_url="http://localhost:8000/v1", model=LLAMA_MODEL, api_key=LLAMA_KEY)
+cache = LLMCache()
 
 SYSTEM_PROMPT = """You are a precise assistant wired to a sensor database.
 
@@ -43,17 +45,18 @@ Prefer calling the tool for requests like:
 """
 
 def probe_models():
-    try:
-        res = client.models.list()
-        names = [m.id for m in getattr(res, "data", [])]
-        print("Models on server:", names)
-        if LLAMA_MODEL not in names:
-            print(f"❌ Model '{LLAMA_MODEL}' not found on the server.")
-            print(f"   Set LLAMA_MODEL to one of: {names}")
+    for backend in client.backends:
+        try:
+            res = backend.client.models.list()
+            names = [m.id for m in getattr(res, "data", [])]
+            print(f"Models on {backend.url}:", names)
+            if LLAMA_MODEL not in names:
+                print(f"❌ Model '{LLAMA_MODEL}' not found on {backend.url}.")
+                print(f"   Set LLAMA_MODEL to one of: {names}")
+                sys.exit(1)
+        except Exception as e:
+            print(f"❌ Could not list models from {backend.url}. Details: {e}")
             sys.exit(1)
-    except Exception as e:
-        print(f"❌ Could not list models from {LLAMA_URL}. Details: {e}")
-        sys.exit(1)
 
 def parse_json_block(text: str) -> Dict[str, Any] | None:
     if not text:
@@ -76,14 +79,26 @@ def parse_json_block(text: str) -> Dict[str, Any] | None:
             return None
     return None
 
-def call_llm(messages):
-    print(f"[debug] calling {LLAMA_URL}/chat/completions with model={LLAMA_MODEL}")
-    r = client.chat.completions.create(
-        model=LLAMA_MODEL,
+def call_llm(messages, cache_messages=None, fingerprint=None):
+    """cache_messages: what identifies the answer (defaults to `messages`);
+    fingerprint: tool data it is grounded on (see llm_cache.tool_fingerprint)."""
+    key_msgs = cache_messages or messages
+    params = {"model": LLAMA_MODEL, "temperature": 0.2}
+    hit = cache.get(key_msgs, params, fingerprint=fingerprint)
+    if hit is not None:
+        print("[debug] cache hit")
+        return hit
+    print(f"[debug] calling chat/completions on {client.urls} with model={LLAMA_MODEL}")
+    t0 = time.monotonic()
+    r = client.chat_sync(
         messages=messages,
         temperature=0.2,
     )
-    return r.choices[0].message.content or ""
+    text = r.choices[0].message.content or ""
+    usage = getattr(r, "usage", None)
+    cache.put(key_msgs, params, text, fingerprint=fingerprint, cost_s=time.monotonic() - t0,
+              tokens=getattr(usage, "completion_tokens", 0) or 0)
+    return text
 
 def run_tool(args: Dict[str, Any]) -> str:
     clean = {
@@ -123,13 +138,15 @@ def answer_with_optional_tool(user_text: str) -> Tuple[str, str | None]:
         if isinstance(parsed, dict) and parsed.get("error"):
             return f"❌ Tool error: {parsed['error']}", tool_json
 
-        # Synthesize a nice answer
+        # Synthesize a nice answer (cached per question + sensor data fingerprint)
+        # (the marker keeps it apart from the tool-routing call on the same question)
+        question = msgs[:2] + [{"role": "system", "content": "answer from TOOL_RESULT_JSON"}]
         msgs.extend([
             {"role": "assistant", "content": first},
             {"role": "system", "content": "Tool call executed. Use TOOL_RESULT_JSON to answer."},
             {"role": "user", "content": f"TOOL_RESULT_JSON:\n{tool_json}\n\nWrite a concise, helpful answer."}
         ])
-        final = call_llm(msgs)
+        final = call_llm(msgs, cache_messages=question, fingerprint=tool_fingerprint(tool_json))
         return final, tool_json
 
     # No tool call requested—just return the LLM text
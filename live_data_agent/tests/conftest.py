@@ -0,0 +1,4 @@
+# The app modules are flat files in live_data_agent/, imported by name.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
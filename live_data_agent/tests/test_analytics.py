@@ -0,0 +1,53 @@
+# Pure NumPy helpers behind analyze_sensor.
+import numpy as np
+import pytest
+
+import trino_tool as tt
+
+
+def _ewma_loop(x, alpha):
+    out, prev = np.empty_like(x), x[0]
+    for i, v in enumerate(x):
+        prev = alpha * v + (1 - alpha) * prev
+        out[i] = prev
+    return out
+
+
+@pytest.mark.parametrize("alpha", [1.0, 0.5, 0.1, 0.01])
+def test_ewma_matches_loop(alpha):
+    x = np.random.default_rng(0).normal(50, 5, 5000)
+    np.testing.assert_allclose(tt._ewma(x, alpha), _ewma_loop(x, alpha), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("alpha", [0.0, -0.1, 1.5, float("nan")])
+def test_ewma_rejects_bad_alpha(alpha):
+    with pytest.raises(ValueError):
+        tt._ewma(np.arange(5.0), alpha)
+
+
+def test_rolling_sums_match_naive():
+    x = np.random.default_rng(1).normal(size=200)
+    k = 7
+    s1, s2 = tt._rolling_sums(x, k)
+    want1 = np.array([x[i - k:i].sum() for i in range(k, len(x))])
+    want2 = np.array([(x[i - k:i] ** 2).sum() for i in range(k, len(x))])
+    np.testing.assert_allclose(s1, want1, atol=1e-9)
+    np.testing.assert_allclose(s2, want2, atol=1e-9)
+
+
+@pytest.mark.parametrize("level", [0.0, 5.0, 5.1, 300.0])
+def test_flat_then_spike_is_flagged_with_finite_z(level):
+    v = np.r_[np.full(100, level), level + 45.0]
+    a = tt._series_analytics(np.arange(101.0), v, 20)["anomalies"]
+    assert a["count"] == 1
+    assert np.isfinite(a["top"][0]["z"]) and a["top"][0]["z"] > tt.ANALYTICS_Z
+
+
+def test_constant_series_has_no_anomalies():
+    a = tt._series_analytics(np.arange(50.0), np.full(50, 5.1), 20)["anomalies"]
+    assert a["count"] == 0
+
+
+def test_block_mean_keeps_tail():
+    arr = np.arange(14.0).reshape(7, 2)
+    np.testing.assert_allclose(tt._block_mean(arr, 3), [[2, 3], [8, 9], [12, 13]])
@@ -0,0 +1,71 @@
+# Pure NumPy helpers behind correlate_sensors.
+import json
+
+import numpy as np
+import pytest
+
+import trino_tool as tt
+
+
+def test_ffill_respects_limit():
+    nan = np.nan
+    m = np.array([[nan, 1.0], [2.0, nan], [nan, nan], [nan, nan], [nan, 4.0]])
+    np.testing.assert_array_equal(
+        tt._ffill(m, 2),
+        np.array([[nan, 1.0], [2.0, 1.0], [2.0, 1.0], [2.0, nan], [nan, 4.0]]))
+
+
+def test_lagged_corr_finds_lag_and_sign():
+    rng = np.random.default_rng(2)
+    lead = rng.normal(size=600)
+    m = np.column_stack([lead, np.r_[np.zeros(5), lead[:-5]], rng.normal(size=600)])
+    c, max_lag = tt._lagged_corr(m, 8)
+    assert max_lag == 8
+    # C[l][i, j] = corr(x_i(t + l), x_j(t)): column 1 follows column 0 by 5 steps.
+    assert int(np.argmax(c[:, 1, 0])) == 5
+    assert c[5, 1, 0] > 0.95
+    assert abs(c[0, 2, 0]) < 0.2
+
+
+def test_lagged_corr_clamps_lag_to_memory_budget(monkeypatch):
+    monkeypatch.setattr(tt, "CORR_MAX_LAG_CELLS", 4 * 4 * 3)
+    c, max_lag = tt._lagged_corr(np.random.default_rng(3).normal(size=(100, 4)), 50)
+    assert max_lag == 2 and c.shape == (3, 4, 4)
+
+
+def test_span_seconds_accepts_timezones():
+    assert tt._span_seconds("2026-10-19T00:00:00+00:00", "2026-10-19T01:00:00+00:00") == 3600.0
+    assert tt._span_seconds("2026-10-19T00:00:00+00:00") is not None
+    assert tt._span_seconds("2026-10-19T00:00:00+00:00", "2026-10-19T01:00:00") is None
+
+
+def test_constant_sensor_has_no_best_lag(monkeypatch):
+    rng = np.random.default_rng(4)
+    t = np.arange(300)
+    vals = {"a": rng.normal(size=300), "b": np.full(300, 7.0), "c": rng.normal(size=300)}
+
+    class Cur:
+        def execute(self, sql):
+            pass
+
+        def fetchall(self):
+            return [(sid, float(i), float(v[i])) for sid, v in vals.items() for i in t]
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(tt, "trino_cursor", Cur)
+    pairs = json.loads(tt.correlate_sensors("a,b,c", window="1h", step_s=18, max_lag=10))["top_pairs"]
+    for p in pairs:
+        if "b" in (p["a"], p["b"]):
+            assert p["corr"] is None and p["lag_corr"] is None
+            assert p["best_lag_steps"] is None and p["best_lag_s"] is None
+        else:
+            assert p["best_lag_steps"] is not None
+
+
+@pytest.mark.parametrize("window", ["1w", "h", "-1h", "1.5h"])
+def test_bad_window_is_a_value_error(window):
+    with pytest.raises(ValueError):
+        tt.correlate_sensors("a,b", window=window)
+    assert tt._span_seconds(window="7d") == 7 * 86400
@@ -0,0 +1,76 @@
+# LLMCache keying, fingerprint invalidation, TTL/LRU eviction and hit accounting.
+import llm_cache
+from llm_cache import LLMCache, tool_fingerprint
+
+PARAMS = {"model": "m", "temperature": 0.0, "max_tokens": 100, "stream_options": {"include_usage": True}}
+
+
+def _msgs(question, history=()):
+    return [{"role": "system", "content": "You are a sensor assistant."}, *history,
+            {"role": "user", "content": question}]
+
+
+def test_final_question_is_folded():
+    k = LLMCache.keys
+    assert k(_msgs("What sensors are there?"), PARAMS) == k(_msgs("  what   sensors are THERE "), PARAMS)
+    assert k(_msgs("what sensors"), PARAMS) != k(_msgs("what sensors"), dict(PARAMS, temperature=0.7))
+    # Params outside _KEY_PARAMS do not split the key.
+    assert k(_msgs("q"), PARAMS) == k(_msgs("q"), {"model": "m", "temperature": 0.0, "max_tokens": 100})
+
+
+def test_history_and_system_prompt_are_exact():
+    k = LLMCache.keys
+    a = [{"role": "user", "content": "read sensor Temp_A"}, {"role": "assistant", "content": '{"sensor_id": "Temp_A"}'}]
+    b = [{"role": "user", "content": "read sensor temp_a"}, {"role": "assistant", "content": '{"sensor_id": "temp_a"}'}]
+    assert k(_msgs("and now?", a), PARAMS)[0] != k(_msgs("and now?", b), PARAMS)[0]
+    sys2 = [{"role": "system", "content": "YOU ARE A SENSOR ASSISTANT"}, {"role": "user", "content": "q"}]
+    assert k(sys2, PARAMS) != k(_msgs("q"), PARAMS)
+    # The context key ignores only the final question.
+    assert k(_msgs("one", a), PARAMS)[1] == k(_msgs("two", a), PARAMS)[1]
+
+
+def test_hit_miss_and_saved_accounting():
+    c = LLMCache(semantic=False)
+    m = _msgs("how many sensors?")
+    assert c.get(m, PARAMS) is None
+    c.put(m, PARAMS, "42", cost_s=1.5, tokens=7)
+    c.put(_msgs("empty"), PARAMS, "")                   # empty replies are never cached
+    assert c.get(m, PARAMS) == "42" and c.get(_msgs("How many sensors"), PARAMS) == "42"
+    st = c.stats()
+    assert (st["hits"], st["misses"], st["entries"]) == (2, 1, 1)
+    assert st["saved_gpu_s"] == 3.0 and st["saved_completion_tokens"] == 14
+    assert st["hit_rate"] == round(2 / 3, 4)
+
+
+def test_fingerprint_change_invalidates():
+    c = LLMCache(semantic=False)
+    m = _msgs("latest for sensor 7?")
+    old = tool_fingerprint({"sensor_id": "7", "summary": {"last_ts": "t1", "count": 10}})
+    new = tool_fingerprint({"sensor_id": "7", "summary": {"last_ts": "t2", "count": 11, "mean": 1}})
+    assert old == tool_fingerprint('{"sensor_id": "7", "summary": {"last_ts": "t1", "count": 10, "mean": 3}}')
+    c.put(m, PARAMS, "old answer", fingerprint=old)
+    assert c.get(m, PARAMS, fingerprint=old) == "old answer"
+    assert c.get(m, PARAMS, fingerprint=new) is None
+    assert c.get(m, PARAMS, fingerprint=old) is None    # dropped, not kept for the old data
+    assert c.stats()["invalidations"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    c = LLMCache(ttl_s=10, semantic=False)
+    m = _msgs("q")
+    c.put(m, PARAMS, "a")
+    now = llm_cache.time.monotonic()
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now + 11)
+    assert c.get(m, PARAMS) is None
+    assert c.stats()["evictions"] == 1 and c.stats()["entries"] == 0
+
+
+def test_lru_bound():
+    c = LLMCache(max_entries=2, semantic=False)
+    for q in ("a", "b"):
+        c.put(_msgs(q), PARAMS, q.upper())
+    assert c.get(_msgs("a"), PARAMS) == "A"            # a is now most recent
+    c.put(_msgs("c"), PARAMS, "C")
+    assert c.get(_msgs("b"), PARAMS) is None
+    assert c.get(_msgs("a"), PARAMS) == "A" and c.get(_msgs("c"), PARAMS) == "C"
+    assert c.stats()["evictions"] == 1
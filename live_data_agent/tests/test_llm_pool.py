@@ -0,0 +1,143 @@
+# LLMPool routing, failover and hedging against real fake_llm.py servers.
+import os, sys, time, socket, asyncio, subprocess
+
+import httpx
+import openai
+import pytest
+
+from llm_pool import LLMPool
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def fake_servers():
+    """name -> base URL: a fast and a slow (time-to-first-token) replica, and a
+    fast one with a 20-token context that answers longer prompts with 400."""
+    procs, urls = [], {}
+    for name, delay in (("fast", "0.05"), ("slow", "2.0"), ("small", "0.05")):
+        port = _free_port()
+        env = dict(os.environ, FAKE_LLM_NAME=name, FAKE_LLM_DELAY_S=delay,
+                   FAKE_LLM_MAX_CONTEXT="20" if name == "small" else "0")
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "fake_llm:app", "--port", str(port), "--log-level", "warning"],
+            cwd=APP_DIR, env=env))
+        urls[name] = f"http://127.0.0.1:{port}/v1"
+    try:
+        deadline = time.monotonic() + 20
+        for url in urls.values():
+            while True:
+                try:
+                    httpx.get(f"{url}/models", timeout=1.0).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+        yield urls
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait(timeout=10)
+
+
+def _dead_url() -> str:
+    return f"http://127.0.0.1:{_free_port()}/v1"
+
+
+async def _ask(pool, text="hello", **kw):
+    return await pool.chat(messages=[{"role": "user", "content": text}], **kw)
+
+
+def test_routes_to_faster_replica(fake_servers):
+    pool = LLMPool([fake_servers["slow"], fake_servers["fast"]], model="m", hedge_after_s=0)
+
+    async def run():
+        for _ in range(6):
+            resp = await _ask(pool)
+        return resp
+
+    resp = asyncio.run(run())
+    by_url = {b["url"]: b for b in pool.stats()["backends"]}
+    # Each replica gets probed once; after that the measured-fast one wins.
+    assert by_url[fake_servers["fast"]]["requests"] >= 5
+    assert resp.choices[0].message.content.startswith("[fast]")
+
+
+def test_fails_over_from_dead_replica(fake_servers):
+    dead = _dead_url()
+    pool = LLMPool([dead, fake_servers["fast"]], model="m", hedge_after_s=0)
+    resp = asyncio.run(_ask(pool))
+    assert resp.choices[0].message.content.startswith("[fast]")
+    by_url = {b["url"]: b for b in pool.stats()["backends"]}
+    assert by_url[dead]["failures"] == 1 and not by_url[dead]["healthy"]
+    assert by_url[fake_servers["fast"]]["inflight"] == 0
+
+
+def test_hedges_slow_first_token(fake_servers):
+    pool = LLMPool([fake_servers["slow"], fake_servers["fast"]], model="m", hedge_after_s=0.3)
+
+    async def first_stream():
+        t0 = time.monotonic()
+        parts = [c.choices[0].delta.content async for c in
+                 pool.stream(messages=[{"role": "user", "content": "hi"}]) if c.choices and c.choices[0].delta.content]
+        return "".join(parts), time.monotonic() - t0
+
+    text, elapsed = asyncio.run(first_stream())
+    assert text.startswith("[fast]")
+    assert pool.hedges == 1
+    assert elapsed < 1.5
+    assert all(b["inflight"] == 0 for b in pool.stats()["backends"])
+
+
+def test_long_generation_is_not_hedged(fake_servers):
+    pool = LLMPool([fake_servers["fast"], fake_servers["fast"] + "/"], model="m", hedge_after_s=0)
+    long_msg = " ".join(["word"] * 60)            # echoed back as ~40 words, 10 ms apart
+
+    async def run():
+        await _ask(pool)
+        await _ask(pool)                          # both clients built and connected
+        pool.hedge_after_s = 0.2
+        t0 = time.monotonic()
+        resp = await _ask(pool, long_msg, max_tokens=800)
+        return resp, time.monotonic() - t0
+
+    resp, elapsed = asyncio.run(run())
+    assert elapsed > 0.3                          # the whole reply outlasts the hedge timer...
+    assert pool.hedges == 0                       # ...but its first token did not
+    assert resp.usage.completion_tokens > 30
+    assert resp.choices[0].finish_reason == "stop"
+
+
+def test_chat_sync_fails_over(fake_servers):
+    pool = LLMPool([_dead_url(), fake_servers["fast"]], model="m", hedge_after_s=0.2)
+    resp = pool.chat_sync(messages=[{"role": "user", "content": "ping"}])
+    assert "ping" in resp.choices[0].message.content
+    assert pool.hedges == 0
+
+
+def test_bad_request_is_not_a_replica_fault(fake_servers):
+    # Three "replicas" behind the same small-context server: one bad prompt, one POST.
+    urls = [fake_servers["small"], fake_servers["small"] + "/", fake_servers["small"] + "//"]
+    pool = LLMPool(urls, model="m", hedge_after_s=0.2)
+    too_long = " ".join(["word"] * 50)
+
+    async def run():
+        with pytest.raises(openai.BadRequestError):
+            await _ask(pool, too_long)
+        return pool.stats()["backends"], await _ask(pool, "ok")
+
+    backends, resp = asyncio.run(run())
+    with pytest.raises(openai.BadRequestError):
+        pool.chat_sync(messages=[{"role": "user", "content": too_long}])
+    assert sum(b["requests"] for b in backends) == 1
+    assert all(b["healthy"] and b["failures"] == 0 and b["inflight"] == 0 for b in backends)
+    assert sum(b["requests"] for b in pool.stats()["backends"]) == 3
+    # The replicas are still usable for a prompt that fits.
+    assert "ok" in resp.choices[0].message.content
@@ -0,0 +1,38 @@
+# since= cursors and HTTP revalidation for sensor polling.
+import pytest
+
+import trino_tool as tt
+from http_cache import etag_for, not_modified
+
+
+@pytest.mark.parametrize("since,want", [
+    ("1700000000000", 1700000000000),
+    ("1700000000000.2", 1700000000001),
+    ("2023-11-14T22:13:20+00:00", 1700000000000),
+    ("2023-11-14T22:13:20.000001Z", 1700000000001),
+    ("2023-11-14 22:13:20", 1700000000000),
+])
+def test_since_ms(since, want):
+    assert tt._since_ms(since) == want
+
+
+@pytest.mark.parametrize("since", ["nan", "inf", "yesterday", "2023-13-40"])
+def test_since_ms_rejects_garbage(since):
+    with pytest.raises(ValueError):
+        tt._since_ms(since)
+
+
+def test_etag_changes_with_version():
+    a = etag_for("s1", "1h", None, None, None, "2026-10-19T00:00:00+00:00", 10)
+    assert a == etag_for("s1", "1h", None, None, None, "2026-10-19T00:00:00+00:00", 10)
+    assert a != etag_for("s1", "1h", None, None, None, "2026-10-19T00:00:01+00:00", 11)
+    assert a.startswith('"') and a.endswith('"')
+
+
+def test_not_modified_matching():
+    tag = etag_for("x")
+    assert not_modified(tag, tag)
+    assert not_modified(f'"other", W/{tag}', tag)
+    assert not_modified("*", tag)
+    assert not not_modified(None, tag)
+    assert not not_modified('"other"', tag)
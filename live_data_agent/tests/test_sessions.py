@@ -0,0 +1,114 @@
+# ChatSession windowing and SessionStore eviction, against an in-process fake pool.
+import asyncio
+from types import SimpleNamespace
+
+import sessions
+from llm_cache import LLMCache
+from sessions import ChatSession, SessionStore, approx_tokens, cap_text
+
+
+class FakePool:
+    """chat() returns a fixed summary; stream() echoes the last user message."""
+
+    def __init__(self, fail_chat=False):
+        self.fail_chat = fail_chat
+        self.chats, self.streams = [], []
+
+    async def chat(self, messages, **kwargs):
+        self.chats.append(messages)
+        if self.fail_chat:
+            raise RuntimeError("down")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="the summary"))])
+
+    async def stream(self, messages, **kwargs):
+        self.streams.append(messages)
+        for word in f"echo {messages[-1]['content']}".split():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2,
+                                                                 prompt_tokens_details=None))
+
+
+def _session(n_exchanges=0, size=100):
+    s = ChatSession("s", "system prompt")
+    for i in range(n_exchanges):
+        s.add_exchange(f"q{i} " + "u" * size, f"a{i} " + "a" * size)
+    return s
+
+
+def test_compact_folds_oldest_half_into_summary():
+    s = _session(8)
+    pool = FakePool()
+    asyncio.run(s.compact(pool, budget=s.history_tokens() - 1))
+    assert len(s.turns) == 8 and s.turns[0]["content"].startswith("q4")
+    assert s.summary == "the summary"
+    assert "q0" in pool.chats[0][1]["content"] and "q4" not in pool.chats[0][1]["content"]
+    assert s.system_message()["content"].endswith("the summary")
+
+
+def test_compact_under_budget_is_a_noop():
+    s = _session(2)
+    pool = FakePool()
+    asyncio.run(s.compact(pool, budget=10_000))
+    assert len(s.turns) == 4 and not pool.chats
+
+
+def test_compact_always_gets_under_budget():
+    # The newest exchange alone is over the budget: everything gets folded.
+    s = _session(1, size=4000)
+    asyncio.run(s.compact(FakePool(), budget=200))
+    assert s.turns == [] and s.summary == "the summary"
+
+    # Newer half still over budget: fold more than half.
+    s = _session(3, size=400)
+    s.add_exchange("big " + "u" * 1000, "ok")
+    budget = approx_tokens(s.turns[-2]["content"]) + approx_tokens("ok")
+    asyncio.run(s.compact(FakePool(), budget=budget))
+    assert s.history_tokens() <= budget and s.turns[0]["content"].startswith("big")
+
+
+def test_compact_drops_history_when_summarizer_fails():
+    s = _session(4)
+    asyncio.run(s.compact(FakePool(fail_chat=True), budget=1))
+    assert s.turns == [] and s.summary == ""
+
+
+def test_oversized_exchange_is_capped_on_add():
+    s = ChatSession("s", "sys")
+    tool_output = "HEAD" + "x" * 100_000 + "TAIL"
+    s.add_exchange("plot sensor 7", tool_output)
+    kept = s.turns[1]["content"]
+    assert approx_tokens(kept) <= sessions.SESSION_MAX_MESSAGE_TOKENS
+    assert kept.startswith("HEAD") and kept.endswith("TAIL") and "chars trimmed" in kept
+    assert s.turns[0]["content"] == "plot sensor 7"
+    assert s.n_turns == 1
+    assert cap_text("short") == "short"
+
+
+def test_reply_records_turn_and_serves_repeat_from_cache():
+    s = ChatSession("s", "sys")
+    pool, cache = FakePool(), LLMCache(semantic=False)
+    assert asyncio.run(s.reply(pool, "hello")) == "echo hello"
+    assert s.n_turns == 1 and s.turn_stats[0]["prompt_tokens"] == 10
+
+    s1, s2 = ChatSession("a", "sys"), ChatSession("b", "sys")
+    assert asyncio.run(s1.reply(pool, "status?", cache=cache)) == "echo status?"
+    assert asyncio.run(s2.reply(pool, "status?", cache=cache)) == "echo status?"
+    assert len(pool.streams) == 2                      # second session hit the cache
+    assert s2.turn_stats[-1]["cache_hit"] and s2.n_turns == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_store_lru_and_idle_eviction(monkeypatch):
+    store = SessionStore("sys", max_sessions=2, idle_ttl_s=60)
+    a = store.get_or_create("a")
+    store.get_or_create("b")
+    assert store.get("a") is a                          # a is now most recent
+    store.get_or_create("c")
+    assert len(store) == 2 and store.get("b") is None and store.get("a") is a
+
+    now = sessions.time.monotonic()
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now + 120)
+    d = store.get_or_create("d")
+    assert len(store) == 1 and store.get("d") is d
+    assert store.drop("d") and not store.drop("d")
+    assert store.get_or_create().id and len(store) == 1
@@ -0,0 +1,131 @@
+# SharedStore: append/compaction, TTLs, resets and lock-free (seqlock) reads.
+import os, json, time, errno, multiprocessing as mp
+
+import pytest
+
+import shared_store
+from shared_store import SharedStore, open_store
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "store")
+
+
+def test_put_get_and_ttl(path):
+    s = SharedStore(path, 1)
+    s.put("a", {"x": 1})
+    s.put_bytes("b", b'"raw"', ttl_s=0.05)
+    assert s.get("a") == {"x": 1}
+    assert s.get_bytes("b") == b'"raw"'
+    time.sleep(0.1)
+    assert s.get_bytes("b") is None
+    # Another handle on the same file sees the same data.
+    assert SharedStore(path, 1).get("a") == {"x": 1}
+
+
+def test_small_put_appends_without_compaction(path):
+    s = SharedStore(path, 1)
+    s.put_bytes("big", b"x" * 300_000)
+    for i in range(20):
+        s.put_bytes(f"k{i}", b"1")
+    assert s.compactions == 0
+    assert s.get_bytes("big") == b"x" * 300_000
+
+
+def test_compaction_keeps_live_values(path):
+    s = SharedStore(path, 1)
+    for i in range(200):
+        s.put_bytes(f"k{i % 10}", json.dumps({"i": i, "pad": "y" * 20_000}).encode())
+    assert s.compactions > 0
+    assert {json.loads(s.get_bytes(f"k{j}"))["i"] for j in range(10)} == set(range(190, 200))
+
+
+def test_capacity_change_resets_instead_of_hanging(path):
+    s = SharedStore(path, 1)
+    s.put_bytes("a", b"1")
+    s.put_bytes("a", b"2")
+    s2 = SharedStore(path, 2)
+    assert s2.get_bytes("a") is None
+    s2.put_bytes("b", b"3")
+    assert s2.get_bytes("b") == b"3"
+
+
+def test_corrupt_index_is_a_bounded_miss(path):
+    s = SharedStore(path, 1)
+    s.put_bytes("a", b"1")
+    _, _, base = s._load_index()
+    s._mm[base + s._u64(32)] = ord("#")           # first byte of the published index
+    s._index_seq = -1
+    assert s.get_bytes("a") is None
+    assert s.read_failures == 1
+    s.put_bytes("b", b"2")                        # a write rebuilds a clean snapshot
+    assert s.get_bytes("b") == b"2"
+
+
+def _no_space_in(dirpath):
+    real = os.posix_fallocate
+
+    def fallocate(fd, offset, length):
+        if os.readlink(f"/proc/self/fd/{fd}").startswith(str(dirpath)):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        return real(fd, offset, length)
+    return fallocate
+
+
+def test_open_store_falls_back_when_full(tmp_path, monkeypatch):
+    full, spare = tmp_path / "shm", tmp_path / "tmp"
+    full.mkdir()
+    spare.mkdir()
+    monkeypatch.setattr(os, "posix_fallocate", _no_space_in(full))
+    monkeypatch.setattr(shared_store.tempfile, "gettempdir", lambda: str(spare))
+    s = open_store(str(full / "store"), 1)
+    assert s is not None and s.path == str(spare / "store")
+    assert os.path.getsize(full / "store") == 0           # reserved space handed back
+    s.put_bytes("a", b"1")
+    assert s.get_bytes("a") == b"1"
+
+
+def test_open_store_disabled_when_nowhere_fits(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "posix_fallocate", _no_space_in(tmp_path))
+    monkeypatch.setattr(shared_store.tempfile, "gettempdir", lambda: str(tmp_path))
+    assert open_store(str(tmp_path / "store"), 1) is None
+
+
+def _writer(path, w, n):
+    s = SharedStore(path, 1)
+    for i in range(n):
+        v = json.dumps({"i": i, "pad": str(i) * (i % 300)}).encode()
+        s.put_many({f"k{w}": v}, raw=True, ttl_s=30)
+
+
+def _reader(path, seconds, q):
+    s = SharedStore(path, 1)
+    seen = bad = 0
+    t_end = time.time() + seconds
+    while time.time() < t_end:
+        for w in range(2):
+            b = s.get_bytes(f"k{w}")
+            if b is None:
+                continue
+            seen += 1
+            try:
+                d = json.loads(b)
+                bad += d["pad"] != str(d["i"]) * (d["i"] % 300)
+            except ValueError:
+                bad += 1
+    q.put((seen, bad))
+
+
+def test_concurrent_readers_never_see_torn_values(path):
+    SharedStore(path, 1)
+    q = mp.Queue()
+    procs = [mp.Process(target=_writer, args=(path, w, 1500)) for w in range(2)]
+    procs += [mp.Process(target=_reader, args=(path, 1.5, q)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    results = [q.get(timeout=5) for _ in range(2)]
+    assert all(seen > 0 for seen, _ in results)
+    assert all(bad == 0 for _, bad in results)
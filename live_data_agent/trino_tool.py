@@ -1,15 +1,33 @@
 # trino_tool.py
-import os, json, re
-from typing import Optional, List
-import numpy as np, requests
-
-from dotenv import load_dotenv
-from trino.dbapi import connect
-from trino.auth import BasicAuthentication
-from trino.exceptions import TrinoUserError
+# numpy and the trino client are imported on first use, and dotenv only when a
+# .env file exists, so importing this module stays cheap at process start.
+from __future__ import annotations
+
+import os, json, re, math, time, logging, importlib, threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any
 from pathlib import Path
 
-load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+_ENV_FILE = Path(__file__).with_name(".env")
+if _ENV_FILE.exists():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=_ENV_FILE)
+logger = logging.getLogger(__name__)
+
+
+class _LazyModule:
+    """Imports the named module on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._mod = None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+np = _LazyModule("numpy")
 
 # ----------------------------- ENV ----------------------------- #
 TRINO_HOST     = os.getenv("TRINO_HOST", "").strip()
@@ -23,24 +41,69 @@ TRINO_SCHEMA   = os.getenv("TRINO_SCHEMA", "public").strip()
 SENSOR_TABLE  = os.getenv("TRINO_SENSOR_TABLE",  "timescale.public.sensor_metadata").strip()
 METRICS_TABLE = os.getenv("TRINO_METRICS_TABLE", "timescale.public.sensor_readings").strip()
 
+# Analytics (analyze_sensor)
+ANALYTICS_MAX_POINTS  = int(os.getenv("ANALYTICS_MAX_POINTS", "20000"))    # above this, Trino pre-buckets the series
+ANALYTICS_CPU_BUDGET_S = float(os.getenv("ANALYTICS_CPU_BUDGET_S", "0.25"))
+ANALYTICS_ROLLING     = int(os.getenv("ANALYTICS_ROLLING", "20"))          # rolling window, in points
+ANALYTICS_EWMA_ALPHA  = float(os.getenv("ANALYTICS_EWMA_ALPHA", "0.1"))     # in (0, 1]
+ANALYTICS_Z           = float(os.getenv("ANALYTICS_Z", "3.0"))
+ANALYTICS_STD_FLOOR   = float(os.getenv("ANALYTICS_STD_FLOOR", "0.01"))   # rolling-std floor, x whole-series std
+ANALYTICS_TOP_N       = int(os.getenv("ANALYTICS_TOP_N", "10"))
+
+if not 0.0 < ANALYTICS_EWMA_ALPHA <= 1.0:
+    raise ValueError(f"ANALYTICS_EWMA_ALPHA must be in (0, 1], got {ANALYTICS_EWMA_ALPHA}")
+
+# Incremental polling (query_sensor_since)
+DELTA_MAX_POINTS = int(os.getenv("DELTA_MAX_POINTS", "1000"))
+
+# Multi-sensor alignment (correlate_sensors)
+CORR_MAX_SENSORS = int(os.getenv("CORR_MAX_SENSORS", "500"))
+CORR_MAX_POINTS  = int(os.getenv("CORR_MAX_POINTS", "2000"))   # grid rows when step is not given
+CORR_MAX_CELLS   = int(os.getenv("CORR_MAX_CELLS", "1000000")) # grid rows x sensors, any step
+CORR_MAX_LAG     = int(os.getenv("CORR_MAX_LAG", "10"))        # lag range in grid steps
+CORR_MAX_LAG_CELLS = int(os.getenv("CORR_MAX_LAG_CELLS", "5000000"))  # (lags+1) x sensors^2; max_lag is clamped to fit
+CORR_FILL_LIMIT  = int(os.getenv("CORR_FILL_LIMIT", "5"))      # forward-fill at most this many empty steps
+
 # Embedding search
 TRINO_TABLE   = os.getenv("TRINO_TABLE", "").strip()
 EMBED_API     = os.getenv("EMBED_API", "").strip()
 EMBED_MODEL   = os.getenv("EMBED_MODEL", "").strip()
 
 # --------------------------- Connection --------------------------- #
+# One connection per thread (executor threads are reused), so its HTTP session
+# and keep-alive sockets stay warm between queries.
+_local = threading.local()
+
 def trino_cursor():
-    conn = connect(
-        host=TRINO_HOST,
-        port=TRINO_PORT,
-        user=TRINO_USER,
-        # Only use BasicAuthentication if password is set AND you're on https
-        auth=BasicAuthentication(TRINO_USER, TRINO_PASSWORD) if TRINO_PASSWORD and TRINO_HOST.startswith("https") else None,
-        catalog=TRINO_CATALOG,
-        schema=TRINO_SCHEMA,
-    )
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        from trino.dbapi import connect
+        from trino.auth import BasicAuthentication
+        conn = connect(
+            host=TRINO_HOST,
+            port=TRINO_PORT,
+            user=TRINO_USER,
+            # Only use BasicAuthentication if password is set AND you're on https
+            auth=BasicAuthentication(TRINO_USER, TRINO_PASSWORD) if TRINO_PASSWORD and TRINO_HOST.startswith("https") else None,
+            catalog=TRINO_CATALOG,
+            schema=TRINO_SCHEMA,
+        )
+        _local.conn = conn
     return conn.cursor()
 
+def ping() -> bool:
+    """SELECT 1 through this thread's connection; warms the client and the coordinator path."""
+    cur = trino_cursor()
+    try:
+        cur.execute("SELECT 1")
+        return cur.fetchone()[0] == 1
+    finally:
+        cur.close()
+
+def warm_up() -> None:
+    """Import the analytics stack ahead of the first request."""
+    np.zeros(1)
+
 
 def _fq(table: str) -> str:
     """Always expand to catalog.schema.table."""
@@ -64,22 +127,58 @@ def list_sensors() -> str:
     cur.close()
     return json.dumps([{"sensor_id": r[0], "name": r[1]} for r in rows], ensure_ascii=False)
 
-def query_sensor(sensor_id: str, start: Optional[str]=None,
-                 end: Optional[str]=None, window: Optional[str]=None) -> str:
-    cur = trino_cursor()
-    where = [f"sensor_id = '{sensor_id}'"]
+_WINDOW_UNITS = {"s": ("SECOND", 1), "m": ("MINUTE", 60), "h": ("HOUR", 3600), "d": ("DAY", 86400)}
+_WINDOW_RE = re.compile(r"^\s*([0-9]+)\s*([smhd])\s*$", re.I)
+
+def _parse_window(window: str):
+    """'24h' -> (24, 'HOUR', 3600). ValueError for anything else."""
+    m = _WINDOW_RE.match(str(window))
+    if not m:
+        raise ValueError(f"bad window={window!r}; use <n>s, <n>m, <n>h or <n>d (e.g. 30m, 24h, 7d)")
+    unit, unit_s = _WINDOW_UNITS[m.group(2).lower()]
+    return int(m.group(1)), unit, unit_s
+
+def _sql_str(v: str) -> str:
+    return "'" + str(v).replace("'", "''") + "'"
+
+def _time_where(start: Optional[str]=None, end: Optional[str]=None,
+                window: Optional[str]=None) -> List[str]:
+    where = []
     if window:
-        unit = {"s": "SECOND","m":"MINUTE","h":"HOUR","d":"DAY"}[window[-1].lower()]
-        n = int(window[:-1])
+        n, unit, _ = _parse_window(window)
         where.append(f"timestamp >= (current_timestamp - INTERVAL '{n}' {unit})")
     else:
         if start: where.append(f"timestamp >= TIMESTAMP '{start}'")
         if end:   where.append(f"timestamp <= TIMESTAMP '{end}'")
-    where_sql = " AND ".join(where)
+    return where
+
+def _where(sensor_id: str, start: Optional[str]=None,
+           end: Optional[str]=None, window: Optional[str]=None) -> str:
+    """WHERE clause for one sensor over a relative window or an absolute range."""
+    return " AND ".join([f"sensor_id = {_sql_str(sensor_id)}"] + _time_where(start, end, window))
+
+def _span_seconds(start: Optional[str]=None, end: Optional[str]=None,
+                  window: Optional[str]=None) -> Optional[float]:
+    if window:
+        n, _, unit_s = _parse_window(window)
+        return n * unit_s
+    try:
+        if start:
+            t0 = datetime.fromisoformat(start)
+            t1 = datetime.fromisoformat(end) if end else datetime.now(timezone.utc if t0.tzinfo else None)
+            return (t1 - t0).total_seconds()
+    except (ValueError, TypeError):       # unparseable, or naive mixed with aware
+        pass
+    return None
+
+def query_sensor(sensor_id: str, start: Optional[str]=None,
+                 end: Optional[str]=None, window: Optional[str]=None) -> str:
+    cur = trino_cursor()
+    where_sql = _where(sensor_id, start, end, window)
 
     summary_sql = f"""
         SELECT MIN(timestamp), MAX(timestamp), COUNT(*),
-               AVG(value), MIN(value), MAX(value)
+               AVG(value), MIN(value), MAX(value), {_MS_CEIL.format("MAX(timestamp)")}
         FROM {_fq(METRICS_TABLE)}
         WHERE {where_sql}
     """
@@ -106,7 +205,441 @@ def query_sensor(sensor_id: str, start: Optional[str]=None,
     cur.close()
     points = [{"ts": r[0].isoformat(), "value": float(r[1])} for r in rows]
 
-    return json.dumps({"sensor_id": sensor_id, "summary": summary, "last_points": points}, ensure_ascii=False)
+    # last_ms is the cursor for polling with since= (see query_sensor_since).
+    return json.dumps({"sensor_id": sensor_id, "summary": summary, "last_points": points,
+                       "last_ms": int(srow[6]) if srow and srow[6] is not None else None}, ensure_ascii=False)
+
+
+# Epoch ms rounded *up*, so `timestamp > from_unixtime(last_ms / 1000)` never
+# re-sends a point with sub-millisecond precision.
+_MS_CEIL = "CAST(ceil(to_unixtime({}) * 1000) AS BIGINT)"
+
+def _since_ms(since: str) -> int:
+    """`since` as epoch ms: either epoch ms (as returned in last_ms) or ISO8601.
+
+    ISO values may carry an offset or Z (e.g. summary.last_ts); naive ones are UTC.
+    """
+    s = str(since).strip()
+    try:
+        ms = float(s)
+    except ValueError:
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            raise ValueError(f"bad since={since!r}; use epoch ms or ISO8601") from None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        us = (dt - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+        return -(-us // 1000)               # exact integer ceil, no float rounding
+    if not math.isfinite(ms):
+        raise ValueError(f"bad since={since!r}; use epoch ms or ISO8601")
+    return math.ceil(ms)
+
+def sensor_version(sensor_id: str, start: Optional[str]=None,
+                   end: Optional[str]=None, window: Optional[str]=None) -> str:
+    """Last timestamp + row count of a selection: one tiny aggregate, used for ETags."""
+    cur = trino_cursor()
+    cur.execute(f"""
+        SELECT MAX(timestamp), COUNT(*), {_MS_CEIL.format("MAX(timestamp)")}
+        FROM {_fq(METRICS_TABLE)}
+        WHERE {_where(sensor_id, start, end, window)}
+    """)
+    r = cur.fetchone()
+    cur.close()
+    return json.dumps({
+        "last_ts": r[0].isoformat() if r and r[0] else None,
+        "count":   int(r[1] or 0) if r else 0,
+        "last_ms": int(r[2]) if r and r[2] is not None else None,
+    })
+
+def query_sensor_since(sensor_id: str, since: str, start: Optional[str]=None,
+                       end: Optional[str]=None, window: Optional[str]=None) -> str:
+    """Points newer than `since`, oldest first, with delta-encoded timestamps:
+    t_i = t0_ms + sum(dt_ms[:i+1]) with dt_ms[0] == 0. Pass last_ms back as the next `since`;
+    with no new points it is the cursor itself, so the client keeps its place.
+    """
+    since_ms = _since_ms(since)
+    cur = trino_cursor()
+    where_sql = _where(sensor_id, start, end, window) + f" AND timestamp > from_unixtime({since_ms / 1000.0})"
+    cur.execute(f"""
+        SELECT {_MS_CEIL.format("timestamp")}, value
+        FROM {_fq(METRICS_TABLE)}
+        WHERE {where_sql}
+        ORDER BY timestamp
+        LIMIT {DELTA_MAX_POINTS}
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    ts = [int(r[0]) for r in rows]
+    return json.dumps({
+        "sensor_id": sensor_id,
+        "since": since,
+        "count": len(rows),
+        "truncated": len(rows) >= DELTA_MAX_POINTS,
+        "t0_ms": ts[0] if ts else None,
+        "dt_ms": [b - a for a, b in zip([ts[0]] + ts, ts)] if ts else [],
+        "values": [float(r[1]) for r in rows],
+        "last_ms": ts[-1] if ts else since_ms,
+    }, ensure_ascii=False)
+
+def latest_values(window: str = "1h", limit: int = 1000) -> str:
+    """Most recent reading per sensor within `window`, in one grouped query."""
+    cur = trino_cursor()
+    where_sql = " AND ".join(_time_where(window=window)) or "TRUE"
+    cur.execute(f"""
+        SELECT sensor_id, MAX(timestamp), MAX_BY(value, timestamp), COUNT(*)
+        FROM {_fq(METRICS_TABLE)}
+        WHERE {where_sql}
+        GROUP BY sensor_id
+        ORDER BY sensor_id
+        LIMIT {int(limit)}
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    return json.dumps([
+        {"sensor_id": r[0], "ts": r[1].isoformat() if r[1] else None,
+         "value": float(r[2]) if r[2] is not None else None, "count": int(r[3] or 0)}
+        for r in rows
+    ], ensure_ascii=False)
+
+# ---------------------------- Analytics ---------------------------- #
+def _rolling_sums(x: np.ndarray, k: int):
+    """Trailing k-point sums of x and x**2 (excluding the current point), via cumsum."""
+    c1 = np.concatenate(([0.0], np.cumsum(x)))
+    c2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    return c1[k:-1] - c1[:-k-1], c2[k:-1] - c2[:-k-1]
+
+def _ewma(x: np.ndarray, alpha: float) -> np.ndarray:
+    """EWMA without a per-row loop: closed form per block, carried across blocks.
+
+    Blocks keep (1-alpha)**-i inside float range; the loop runs once per block,
+    not per point.
+    """
+    if not 0.0 < alpha <= 1.0:
+        raise ValueError(f"EWMA alpha must be in (0, 1], got {alpha}")
+    decay = 1.0 - alpha
+    if decay == 0.0:
+        return x.copy()
+    block = max(1, int(min(300.0 / -np.log1p(-alpha), 1e9)))
+    out = np.empty_like(x)
+    prev = x[0]
+    for s in range(0, len(x), block):
+        xb = x[s:s + block]
+        j = np.arange(len(xb))
+        pw = decay ** j
+        # y_j = decay^(j+1) * prev + alpha * sum_{i<=j} decay^(j-i) x_i
+        out[s:s + block] = decay * pw * prev + alpha * pw * np.cumsum(xb / pw)
+        prev = out[s + len(xb) - 1]
+    return out
+
+def _block_mean(arr: np.ndarray, factor: int) -> np.ndarray:
+    """Average consecutive rows in blocks of `factor` (the last block may be shorter)."""
+    n = len(arr) // factor * factor
+    out = arr[:n].reshape(-1, factor, arr.shape[1]).mean(axis=1)
+    if n < len(arr):
+        out = np.vstack([out, arr[n:].mean(axis=0)])
+    return out
+
+# CPU seconds per point of _series_analytics, learned from previous calls; used
+# to downsample up front so a call stays within ANALYTICS_CPU_BUDGET_S.
+_analytics_cpu_per_point = 0.0
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat()
+
+def _series_analytics(ts: np.ndarray, v: np.ndarray, k: int) -> Dict[str, Any]:
+    n = len(v)
+    out: Dict[str, Any] = {"points": n}
+    if n == 0:
+        return out
+    mu = float(v.mean())
+    out["last"] = {"ts": _iso(ts[-1]), "value": float(v[-1])}
+
+    ew = _ewma(v, ANALYTICS_EWMA_ALPHA)
+    out["ewma_last"] = float(ew[-1])
+
+    if n >= 2:
+        dt = np.diff(ts)
+        dt[dt <= 0] = np.nan
+        rate = np.diff(v) / dt                       # units per second
+        if np.isfinite(rate).any():
+            i_up, i_dn = int(np.nanargmax(rate)), int(np.nanargmin(rate))
+            out["rate_per_min"] = {
+                "last": float(rate[-1] * 60) if np.isfinite(rate[-1]) else None,
+                "mean": float(np.nanmean(rate) * 60),
+                "max_rise": {"ts": _iso(ts[i_up + 1]), "value": float(rate[i_up] * 60)},
+                "max_fall": {"ts": _iso(ts[i_dn + 1]), "value": float(rate[i_dn] * 60)},
+            }
+        span = ts[-1] - ts[0]
+        if span > 0:
+            slope = np.polyfit(ts - ts[0], v, 1)[0]
+            out["trend_per_hour"] = float(slope * 3600)
+
+    k = min(k, n - 1)
+    if k >= 2:
+        # Centre on the mean so cumsum-of-squares does not lose precision.
+        x = v - mu
+        s1, s2 = _rolling_sums(x, k)
+        rmean = s1 / k
+        rstd = np.sqrt(np.maximum(s2 / k - rmean * rmean, 0.0))
+        out["rolling"] = {"window_points": k, "mean_last": float(rmean[-1] + mu), "std_last": float(rstd[-1])}
+
+        # Flat (stuck) windows have rstd ~ 0, or float noise around it: floor it at a
+        # fraction of the whole series' spread so a stuck-then-spike series is always
+        # flagged with a finite z. A fully constant series has no anomalies.
+        rstd_z = np.maximum(rstd, ANALYTICS_STD_FLOOR * float(x.std()))
+        cur = x[k:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(rstd_z > 0, (cur - rmean) / rstd_z, 0.0)
+        flagged = np.flatnonzero(np.abs(z) > ANALYTICS_Z)
+        top = flagged[np.argsort(-np.abs(z[flagged]))[:ANALYTICS_TOP_N]]
+        top.sort()
+        out["anomalies"] = {
+            "z_threshold": ANALYTICS_Z,
+            "count": int(len(flagged)),
+            "top": [{"ts": _iso(ts[i + k]), "value": float(v[i + k]), "z": round(float(z[i]), 2)} for i in top],
+        }
+    return out
+
+def analyze_sensor(sensor_id: str, start: Optional[str]=None,
+                   end: Optional[str]=None, window: Optional[str]=None) -> str:
+    """Percentiles/stddev in Trino, rolling stats, EWMA, z-score anomalies and
+    rate of change in NumPy. Returns compact JSON the LLM can summarize as-is.
+
+    The fetched series is capped at ANALYTICS_MAX_POINTS (Trino averages into
+    time buckets above that), which bounds the NumPy work to ANALYTICS_CPU_BUDGET_S.
+    """
+    cur = trino_cursor()
+    where_sql = _where(sensor_id, start, end, window)
+    table = _fq(METRICS_TABLE)
+
+    cur.execute(f"""
+        SELECT COUNT(*), MIN(timestamp), MAX(timestamp),
+               AVG(value), STDDEV_SAMP(value), MIN(value), MAX(value),
+               APPROX_PERCENTILE(value, ARRAY[0.05, 0.5, 0.95, 0.99]),
+               to_unixtime(MIN(timestamp)), to_unixtime(MAX(timestamp))
+        FROM {table}
+        WHERE {where_sql}
+    """)
+    r = cur.fetchone()
+    count = int(r[0] or 0) if r else 0
+    pct = list(r[7]) if r and r[7] else [None] * 4
+    summary = {
+        "count":    count,
+        "first_ts": r[1].isoformat() if r and r[1] else None,
+        "last_ts":  r[2].isoformat() if r and r[2] else None,
+        "avg":      float(r[3]) if r and r[3] is not None else None,
+        "stddev":   float(r[4]) if r and r[4] is not None else None,
+        "min":      float(r[5]) if r and r[5] is not None else None,
+        "max":      float(r[6]) if r and r[6] is not None else None,
+        "p05": pct[0], "p50": pct[1], "p95": pct[2], "p99": pct[3],
+    }
+    result: Dict[str, Any] = {"sensor_id": sensor_id, "summary": summary}
+    if not count:
+        cur.close()
+        return json.dumps(result, ensure_ascii=False)
+
+    bucket_s = None
+    if count > ANALYTICS_MAX_POINTS and r[8] is not None and r[9] is not None:
+        bucket_s = max(1.0, float(r[9] - r[8]) / ANALYTICS_MAX_POINTS)
+        cur.execute(f"""
+            SELECT floor(to_unixtime(timestamp) / {bucket_s}) * {bucket_s} AS t, AVG(value)
+            FROM {table}
+            WHERE {where_sql}
+            GROUP BY 1
+            ORDER BY 1
+        """)
+    else:
+        cur.execute(f"""
+            SELECT to_unixtime(timestamp), CAST(value AS DOUBLE)
+            FROM {table}
+            WHERE {where_sql}
+            ORDER BY timestamp
+            LIMIT {ANALYTICS_MAX_POINTS}
+        """)
+    rows = cur.fetchall()
+    cur.close()
+
+    global _analytics_cpu_per_point
+    # thread_time: this runs on shared executor threads, process time would bill
+    # other requests' work to this one.
+    t0 = time.thread_time()
+    arr = np.asarray(rows, dtype=np.float64).reshape(-1, 2)
+    arr = arr[np.isfinite(arr).all(axis=1)]
+    downsample = 1
+    if _analytics_cpu_per_point > 0:
+        left = ANALYTICS_CPU_BUDGET_S - (time.thread_time() - t0)
+        fit = max(int(left / _analytics_cpu_per_point), 2 * ANALYTICS_ROLLING)
+        if len(arr) > fit:
+            downsample = -(-len(arr) // fit)
+            arr = _block_mean(arr, downsample)
+    t1 = time.thread_time()
+    series = _series_analytics(arr[:, 0], arr[:, 1], ANALYTICS_ROLLING)
+    cpu_s = time.thread_time() - t0
+    if len(arr):
+        per_point = (time.thread_time() - t1) / len(arr)
+        _analytics_cpu_per_point = per_point if not _analytics_cpu_per_point else (
+            0.3 * per_point + 0.7 * _analytics_cpu_per_point)
+    if cpu_s > ANALYTICS_CPU_BUDGET_S:
+        logger.warning("analyze_sensor(%s): %.3fs CPU over %.3fs budget; later calls will downsample",
+                       sensor_id, cpu_s, ANALYTICS_CPU_BUDGET_S)
+
+    result["series"] = series
+    result["bucket_s"] = bucket_s
+    result["downsample"] = downsample
+    result["cpu_ms"] = round(cpu_s * 1000, 2)
+    return json.dumps(result, ensure_ascii=False)
+
+
+# ------------------------ Multi-sensor alignment ------------------------ #
+def _ffill(m: np.ndarray, limit: int) -> np.ndarray:
+    """Forward-fill NaNs down each column, at most `limit` rows past the last observation."""
+    rows = np.arange(m.shape[0])[:, None]
+    last = np.where(np.isnan(m), -1, rows)
+    np.maximum.accumulate(last, axis=0, out=last)
+    cols = np.broadcast_to(np.arange(m.shape[1]), m.shape)
+    filled = np.where(last >= 0, m[np.maximum(last, 0), cols], np.nan)
+    filled[(rows - last) > limit] = np.nan
+    return filled
+
+def align_sensors(sensor_ids: List[str], start: Optional[str]=None, end: Optional[str]=None,
+                  window: Optional[str]=None, step_s: Optional[float]=None,
+                  fill_limit: int = CORR_FILL_LIMIT):
+    """Fetch N sensors in one Trino query, bucketed onto a common grid.
+
+    Returns (grid_ts, ids, matrix, observed): matrix is T x N float64 with gaps
+    forward-filled up to `fill_limit` steps (NaN beyond), observed is the
+    per-column fraction of grid rows that had real data.
+    """
+    ids = list(dict.fromkeys(str(s) for s in sensor_ids if str(s).strip()))
+    if not ids:
+        raise ValueError("sensor_ids is empty")
+    if len(ids) > CORR_MAX_SENSORS:
+        raise ValueError(f"too many sensors ({len(ids)} > CORR_MAX_SENSORS={CORR_MAX_SENSORS})")
+    if not (window or start):
+        window = "1h"
+    span = _span_seconds(start, end, window)
+    if step_s is None:
+        step_s = max(1.0, (span or 3600) / CORR_MAX_POINTS)
+    step_s = float(step_s)
+    if not (step_s > 0 and math.isfinite(step_s)):
+        raise ValueError(f"step must be a positive number of seconds, got {step_s}")
+    max_rows = max(1, CORR_MAX_CELLS // len(ids))
+    if span and span / step_s > max_rows:
+        raise ValueError(f"step {step_s}s is too fine for this range: ~{int(span / step_s)} grid rows "
+                         f"for {len(ids)} sensors (limit {max_rows}, CORR_MAX_CELLS={CORR_MAX_CELLS})")
+
+    where = [f"sensor_id IN ({', '.join(_sql_str(i) for i in ids)})"] + _time_where(start, end, window)
+    cur = trino_cursor()
+    cur.execute(f"""
+        SELECT CAST(sensor_id AS VARCHAR),
+               floor(to_unixtime(timestamp) / {step_s}) AS b,
+               AVG(CAST(value AS DOUBLE))
+        FROM {_fq(METRICS_TABLE)}
+        WHERE {' AND '.join(where)}
+        GROUP BY 1, 2
+        LIMIT {CORR_MAX_CELLS + 1}
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    if len(rows) > CORR_MAX_CELLS:
+        raise ValueError(f"more than CORR_MAX_CELLS={CORR_MAX_CELLS} buckets; use a coarser step or a shorter range")
+
+    n = len(ids)
+    if not rows:
+        return np.empty(0), ids, np.empty((0, n)), np.zeros(n)
+
+    raw = np.asarray(rows, dtype=object)
+    sid, bv = raw[:, 0], raw[:, 1:].astype(np.float64)
+    order = np.argsort(np.array(ids, dtype=object))
+    sorted_ids = np.array(ids, dtype=object)[order]
+    col = order[np.searchsorted(sorted_ids, sid)]
+
+    b0 = bv[:, 0].min()
+    ti = (bv[:, 0] - b0).astype(np.int64)
+    if int(ti.max()) + 1 > max_rows:
+        # Unknown span (e.g. start only) or sparse data: check before allocating the grid.
+        raise ValueError(f"{int(ti.max()) + 1} grid rows for {n} sensors exceeds the limit of {max_rows}; "
+                         "use a coarser step or a shorter range")
+    grid = (b0 + np.arange(int(ti.max()) + 1)) * step_s
+
+    m = np.full((len(grid), n), np.nan)
+    m[ti, col] = bv[:, 1]
+    observed = (~np.isnan(m)).mean(axis=0)
+    return grid, ids, _ffill(m, fill_limit), observed
+
+def _lagged_corr(m: np.ndarray, max_lag: int):
+    """Pearson correlation at lags 0..max_lag for all pairs at once.
+
+    Returns (C, L): C[l][i, j] = corr(x_i(t + l), x_j(t)); negative lags are C[l].T.
+    One T x N x N matmul per lag, no Python loop over pairs.
+    """
+    t, n = m.shape
+    mu = np.nanmean(m, axis=0)
+    z = np.where(np.isnan(m), 0.0, m - mu)          # residual gaps contribute nothing
+    sd = np.sqrt((z * z).sum(axis=0) / max(t, 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(sd > 0, z / sd, 0.0)
+    max_lag = max(0, min(max_lag, t - 2, CORR_MAX_LAG_CELLS // max(n * n, 1) - 1))
+    c = np.empty((max_lag + 1, n, n))
+    for l in range(max_lag + 1):
+        c[l] = z[l:].T @ z[:t - l] / (t - l)
+    c[:, sd == 0, :] = np.nan
+    c[:, :, sd == 0] = np.nan
+    return c, max_lag
+
+def correlate_sensors(sensor_ids, start: Optional[str]=None, end: Optional[str]=None,
+                      window: Optional[str]=None, step_s: Optional[float]=None,
+                      max_lag: int = CORR_MAX_LAG, top_n: int = ANALYTICS_TOP_N,
+                      include_matrix: bool = False) -> str:
+    """Align N sensors on one grid and report pairwise and lagged correlation.
+
+    `sensor_ids` is a list or a comma-separated string. The compact result lists
+    the strongest pairs (zero-lag corr plus best lag within ±max_lag steps;
+    best_lag_steps > 0 means `a` follows `b`); include_matrix=True adds the
+    full zero-lag matrix.
+    """
+    if isinstance(sensor_ids, str):
+        sensor_ids = [s.strip() for s in sensor_ids.split(",")]
+    grid, ids, m, observed = align_sensors(sensor_ids, start, end, window, step_s)
+    step = float(grid[1] - grid[0]) if len(grid) > 1 else (step_s or None)
+    result: Dict[str, Any] = {
+        "sensor_ids": ids,
+        "step_s": step,
+        "grid": {"points": int(len(grid)),
+                 "start": _iso(grid[0]) if len(grid) else None,
+                 "end": _iso(grid[-1]) if len(grid) else None},
+        "coverage": {i: round(float(o), 3) for i, o in zip(ids, observed)},
+    }
+    if len(grid) < 3 or len(ids) < 2:
+        result["top_pairs"] = []
+        return json.dumps(result, ensure_ascii=False)
+
+    t0 = time.thread_time()
+    c, max_lag = _lagged_corr(m, max_lag)
+    # Lags -L..L per pair: a negative lag is the transposed entry of the positive one.
+    lags = np.arange(-max_lag, max_lag + 1)
+    iu, ju = np.triu_indices(len(ids), k=1)
+    pair_lag = np.concatenate([c[:0:-1, ju, iu], c[:, iu, ju]], axis=0)   # (2L+1) x P
+    absl = np.nan_to_num(np.abs(pair_lag), nan=-1.0)
+    best = absl.argmax(axis=0)
+    best_corr = pair_lag[best, np.arange(len(iu))]
+    zero = c[0][iu, ju]
+    rank = np.argsort(-np.nan_to_num(np.abs(zero), nan=-1.0))[:top_n]
+
+    result["max_lag_steps"] = int(max_lag)
+    result["top_pairs"] = [{
+        "a": ids[iu[p]], "b": ids[ju[p]],
+        "corr": None if np.isnan(zero[p]) else round(float(zero[p]), 4),
+        # An all-NaN lag curve (constant or empty sensor) has no best lag.
+        "best_lag_steps": None if np.isnan(best_corr[p]) else int(lags[best[p]]),
+        "best_lag_s": float(lags[best[p]] * step) if step and not np.isnan(best_corr[p]) else None,
+        "lag_corr": None if np.isnan(best_corr[p]) else round(float(best_corr[p]), 4),
+    } for p in rank]
+    if include_matrix:
+        result["matrix"] = [[None if np.isnan(x) else round(float(x), 4) for x in row] for row in c[0]]
+    result["cpu_ms"] = round((time.thread_time() - t0) * 1000, 2)
+    return json.dumps(result, ensure_ascii=False)
 
 
 def debug_trino_topology():